@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add the community membership table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3f0b9c6d2e81'
+down_revision = 'c2b5e8a1f4d7'
+branch_labels = ()
+depends_on = ('9848d0149abd', '862037093962')
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'communities_community_membership',
+        sa.Column('id_community', sa.String(length=100), nullable=False),
+        sa.Column('id_record', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('accepted_at', sa.DateTime(), nullable=False),
+        sa.Column('id_user', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['id_community'],
+                                [u'communities_community.id'], ),
+        sa.ForeignKeyConstraint(['id_record'], [u'records_metadata.id'], ),
+        sa.ForeignKeyConstraint(['id_user'], [u'accounts_user.id'], ),
+        sa.PrimaryKeyConstraint('id_community', 'id_record')
+    )
+    op.create_index(
+        op.f('ix_communities_community_membership_id_record'),
+        'communities_community_membership',
+        ['id_record'],
+        unique=False
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(op.f('ix_communities_community_membership_id_record'),
+                  table_name='communities_community_membership')
+    op.drop_table('communities_community_membership')
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add the search indexes of the communities."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6c1d3f5e8b20'
+down_revision = 'e31b43dedf06'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'communities_community_term',
+        sa.Column('id_community', sa.String(length=100), nullable=False),
+        sa.Column('term', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['id_community'],
+                                [u'communities_community.id'], ),
+        sa.PrimaryKeyConstraint('id_community', 'term')
+    )
+    op.create_index(
+        op.f('ix_communities_community_term_term'),
+        'communities_community_term',
+        ['term'],
+        unique=False
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX ix_communities_community_fts '
+            'ON communities_community USING gin '
+            "(to_tsvector('simple', title || ' ' || description))")
+        op.execute(
+            'CREATE INDEX ix_communities_community_id_trgm '
+            'ON communities_community USING gin (id gin_trgm_ops)')
+        op.execute(
+            'CREATE INDEX ix_communities_community_title_trgm '
+            'ON communities_community USING gin (title gin_trgm_ops)')
+
+
+def downgrade():
+    """Downgrade database."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_communities_community_title_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_communities_community_id_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_communities_community_fts')
+    op.drop_index(op.f('ix_communities_community_term_term'),
+                  table_name='communities_community_term')
+    op.drop_table('communities_community_term')
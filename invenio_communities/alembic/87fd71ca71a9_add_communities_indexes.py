@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add indexes on communities and inclusion requests."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '87fd71ca71a9'
+down_revision = '6c1d3f5e8b20'
+branch_labels = ()
+depends_on = None
+
+INDEXES = [
+    ('ix_communities_community_deleted_at_ranking', 'communities_community',
+     ['deleted_at', 'ranking']),
+    ('ix_communities_community_deleted_at_title', 'communities_community',
+     ['deleted_at', 'title']),
+    ('ix_communities_community_id_user', 'communities_community',
+     ['id_user']),
+    ('ix_communities_community_record_id_record',
+     'communities_community_record', ['id_record']),
+    ('ix_communities_community_record_id_user',
+     'communities_community_record', ['id_user']),
+    ('ix_communities_community_record_expires_at',
+     'communities_community_record', ['expires_at']),
+    ('ix_communities_featured_community_start_date',
+     'communities_featured_community', ['start_date']),
+]
+
+
+def upgrade():
+    """Upgrade database."""
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    """Downgrade database."""
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add the sharded counters of the communities."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9a6e4d1b7c35'
+down_revision = '3f0b9c6d2e81'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'communities_community_counter',
+        sa.Column('id_community', sa.String(length=100), nullable=False),
+        sa.Column('shard', sa.Integer(), autoincrement=False,
+                  nullable=False),
+        sa.Column('records', sa.Integer(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('last_activity', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['id_community'],
+                                [u'communities_community.id'], ),
+        sa.PrimaryKeyConstraint('id_community', 'shard')
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('communities_community_counter')
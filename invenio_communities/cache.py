@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Caches of the communities data."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import time
+
+from flask import current_app, g
+from invenio_db import db
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models import Community, CommunityGeneration, FeaturedCommunity
+
+_SESSION_KEY = 'communities_invalidated'
+
+
+class LRUCache(object):
+    """In-process cache evicting the least recently used entries.
+
+    It implements the interface of the werkzeug caches, so that it can be
+    replaced by a cache shared between the processes, e.g.
+    ``werkzeug.contrib.cache.RedisCache``.
+    """
+
+    def __init__(self, threshold=500, default_timeout=300):
+        """Initialize the cache.
+
+        :param threshold: Maximum number of entries.
+        :param default_timeout: Default time to live of the entries, in
+            seconds. ``0`` means that the entries never expire.
+        """
+        self.threshold = threshold
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get an entry, or ``None`` if it is missing or expired."""
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return None
+            if expires and expires <= time():
+                return None
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Set an entry, evicting the least recently used ones if needed."""
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time() + timeout if timeout else 0
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.threshold:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        """Delete an entry."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Delete all the entries."""
+        with self._lock:
+            self._entries.clear()
+        return True
+
+
+def get_rest_cache():
+    """Get the cache of the REST responses, or ``None`` if it is disabled."""
+    return current_app.extensions['invenio-communities'].rest_cache
+
+
+def get_page_cache():
+    """Get the cache of the UI pages, or ``None`` if it is disabled."""
+    return current_app.extensions['invenio-communities'].page_cache
+
+
+def get_object_cache():
+    """Get the cache of the communities, or ``None`` if it is disabled."""
+    return current_app.extensions['invenio-communities'].object_cache
+
+
+def _snapshot(community):
+    """Get the loaded column values of a community."""
+    loaded = inspect(community).dict
+    return dict((attr.key, loaded[attr.key])
+                for attr in inspect(Community).column_attrs
+                if attr.key in loaded)
+
+
+def _restore(snapshot):
+    """Merge a community snapshot in the session without any query.
+
+    The columns missing from the snapshot are loaded on access.
+    """
+    community = Community(**snapshot)
+    make_transient_to_detached(community)
+    return db.session.merge(community, load=False)
+
+
+def get_community(community_id, options=()):
+    """Get a community through the cache of the communities.
+
+    The cache holds the loaded column values of the communities, and an
+    empty snapshot for the unknown or deleted ones, for the current
+    generation of the communities. A cached community is merged in the
+    session without any query; its deferred columns are loaded on access.
+
+    :param community_id: ID of the community.
+    :param options: Query options. The communities loaded with options are
+        not cached.
+    :returns: The community, or ``None`` if it does not exist.
+    """
+    cache = get_object_cache()
+    if cache is None or options or is_invalidated():
+        return Community.get(community_id, options=options)
+    key = u'communities:community:{0}:{1}'.format(
+        get_generation(), community_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        community = Community.get(community_id)
+        snapshot = _snapshot(community) if community is not None else {}
+        cache.set(key, snapshot, timeout=current_app.config[
+            'COMMUNITIES_OBJECT_CACHE_TIMEOUT'])
+        return community
+    return _restore(snapshot) if snapshot else None
+
+
+def get_featured_community(now=None):
+    """Get the featured community, cached until the featuring changes.
+
+    The featured community is kept in the process for the current generation
+    of the communities, until the start date of the next featuring.
+
+    :param now: Current date (defaults to now).
+    :returns: The featured community, or ``None``.
+    """
+    now = now or datetime.utcnow()
+    if is_invalidated():
+        return FeaturedCommunity.get_featured_or_none(now)
+    ext = current_app.extensions['invenio-communities']
+    generation = get_generation()
+    cached = ext.featured_community
+    if cached is not None:
+        cached_generation, expires_at, snapshot = cached
+        if cached_generation == generation and \
+                (expires_at is None or now < expires_at):
+            return _restore(snapshot) if snapshot else None
+
+    community = FeaturedCommunity.get_featured_or_none(now)
+    ext.featured_community = (
+        generation,
+        FeaturedCommunity.get_next_start_date(now),
+        _snapshot(community) if community is not None else None,
+    )
+    return community
+
+
+def invalidate_communities(session=None):
+    """Invalidate the caches of the communities in the current transaction.
+
+    The generation of the communities is incremented when the transaction is
+    committed. The mapper events of the communities, featured communities,
+    inclusion requests and permissions call it, but it must be called
+    explicitly when these are modified with SQL statements.
+    """
+    session = session or db.session
+    session.info[_SESSION_KEY] = True
+
+
+def is_invalidated(session=None):
+    """Check if the current transaction modified the communities.
+
+    The caches are bypassed in such a transaction, as they do not reflect
+    its changes.
+    """
+    session = session or db.session
+    return session.info.get(_SESSION_KEY, False)
+
+
+def pop_invalidation(session):
+    """Get and forget if the transaction modified the communities."""
+    return session.info.pop(_SESSION_KEY, False)
+
+
+def get_generation():
+    """Get the generation of the communities, read once per request.
+
+    The caches include it in their keys, so that the entries of all the
+    processes are invalidated when the communities are modified.
+    """
+    generation = getattr(g, '_communities_generation', None)
+    if generation is None:
+        generation = g._communities_generation = CommunityGeneration.get()
+    return generation
+
+
+def forget_generation():
+    """Read the generation of the communities again."""
+    g._communities_generation = None
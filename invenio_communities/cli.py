@@ -26,14 +26,19 @@
 
 from __future__ import absolute_import, print_function
 
+from datetime import datetime
+
 import click
+from flask import current_app
 from flask_cli import with_appcontext
 from invenio_db import db
 from invenio_files_rest.errors import FilesException
-from invenio_indexer.api import RecordIndexer
 from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
 
-from .models import Community, InclusionRequest
+from .indexer import reindex_records
+from .models import Community, CommunityCounter, CommunityMembership, \
+    CommunityTerm, InclusionRequest
 from .utils import initialize_communities_bucket, save_and_validate_logo
 
 
@@ -56,6 +61,68 @@ def init():
         click.secho(e.message, fg='red')
 
 
+@communities.command('reindex-terms')
+@with_appcontext
+def reindex_terms():
+    """Rebuild the inverted index of the communities words."""
+    CommunityTerm.query.delete()
+    rows = []
+    for c in db.session.query(
+            Community.id, Community.title, Community.description):
+        rows.extend(dict(id_community=c.id, term=term)
+                    for term in CommunityTerm.terms_for(c))
+    if rows:
+        db.session.execute(CommunityTerm.__table__.insert(), rows)
+    db.session.commit()
+    click.secho('Communities terms reindexed.', fg='green')
+
+
+@communities.command('backfill-membership')
+@click.option('--chunk-size', default=500, type=int,
+              help='Number of records processed per transaction.')
+@with_appcontext
+def backfill_membership(chunk_size):
+    """Synchronize the membership table with the records communities."""
+    key = current_app.config['COMMUNITIES_RECORD_KEY']
+    community_ids = set(id_ for (id_, ) in db.session.query(Community.id))
+    table = CommunityMembership.__table__
+    now = datetime.utcnow()
+    added = removed = 0
+    last_id = None
+    while True:
+        query = db.session.query(RecordMetadata.id, RecordMetadata.json) \
+            .filter(RecordMetadata.json.isnot(None))
+        if last_id is not None:
+            query = query.filter(RecordMetadata.id > last_id)
+        rows = query.order_by(RecordMetadata.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        expected = set(
+            (id_community, row.id) for row in rows
+            for id_community in row.json.get(key) or []
+            if id_community in community_ids)
+        existing = set(db.session.query(
+            table.c.id_community, table.c.id_record
+        ).filter(table.c.id_record.in_([row.id for row in rows])))
+
+        missing = expected - existing
+        if missing:
+            db.session.execute(table.insert(), [
+                dict(id_community=c, id_record=r, accepted_at=now)
+                for c, r in missing])
+        for id_community, id_record in existing - expected:
+            db.session.execute(table.delete().where(db.and_(
+                table.c.id_community == id_community,
+                table.c.id_record == id_record)))
+        db.session.commit()
+        added += len(missing)
+        removed += len(existing - expected)
+    click.secho('Memberships added: {0}, removed: {1}.'.format(
+        added, removed), fg='green')
+
+
 @communities.command()
 @click.argument('community_id')
 @click.argument('logo', type=click.File('rb'))
@@ -73,6 +140,39 @@ def addlogo(community_id, logo):
     db.session.commit()
 
 
+@communities.command('reconcile-counters')
+@with_appcontext
+def reconcile_counters():
+    """Recompute the communities counters from the source tables.
+
+    The counts of accepted records come from the membership table, which
+    must have been backfilled.
+    """
+    records = dict(db.session.query(
+        CommunityMembership.id_community, db.func.count()
+    ).group_by(CommunityMembership.id_community))
+    requests = dict(db.session.query(
+        InclusionRequest.id_community, db.func.count()
+    ).group_by(InclusionRequest.id_community))
+    last_request = dict(db.session.query(
+        InclusionRequest.id_community, db.func.max(InclusionRequest.created)
+    ).group_by(InclusionRequest.id_community))
+
+    CommunityCounter.query.delete()
+    rows = []
+    for id_, last_accepted in db.session.query(
+            Community.id, Community.last_record_accepted):
+        activity = [d for d in (last_accepted, last_request.get(id_)) if d]
+        rows.append(dict(
+            id_community=id_, shard=0,
+            records=records.get(id_, 0), requests=requests.get(id_, 0),
+            last_activity=max(activity) if activity else None))
+    if rows:
+        db.session.execute(CommunityCounter.__table__.insert(), rows)
+    db.session.commit()
+    click.secho('Communities counters reconciled.', fg='green')
+
+
 @communities.command()
 @click.argument('community_id')
 @click.argument('record_id')
@@ -89,8 +189,8 @@ def request(community_id, record_id, accept):
     else:
         InclusionRequest.create(community=c, record=record,
                                 notify=False)
+    reindex_records([record.id])
     db.session.commit()
-    RecordIndexer().index_by_id(record.id)
 
 
 @communities.command()
@@ -101,6 +201,8 @@ def remove(community_id, record_id):
     """Remove a record from community."""
     c = Community.get(community_id)
     assert c is not None
-    c.remove_record(record_id)
+    record = Record.get_record(record_id)
+    c.remove_record(record)
+    record.commit()
+    reindex_records([record.id])
     db.session.commit()
-    RecordIndexer().index_by_id(record_id)
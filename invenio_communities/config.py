@@ -36,11 +36,91 @@ COMMUNITIES_NAME_PLURAL = "communities"
 """Used to tell how we name the communities in invenio"""
 
 COMMUNITIES_REQUEST_EXPIRY_TIME = timedelta(days=365)
-"""Time after which the inclusion requests automatically expire."""
+"""Time after which the inclusion requests automatically expire.
+
+Set to ``None`` to create requests which never expire.
+"""
+
+COMMUNITIES_REQUEST_EXPIRY_CHUNK_SIZE = 500
+"""Number of expired inclusion requests deleted per transaction."""
 
 COMMUNITIES_DELETE_HOLDOUT_TIME = timedelta(days=365)
 """Time after which the communities marked for deletion are hard-deleted."""
 
+COMMUNITIES_DELETE_CHUNK_SIZE = 500
+"""Number of records stripped of a deleted community per transaction."""
+
+COMMUNITIES_REINDEX_ASYNC = True
+"""Index the records modified by the communities through the bulk queue.
+
+The records are sent to the indexer queue once the transaction is committed.
+If ``False``, they are indexed synchronously right before the commit (e.g.
+for testing).
+"""
+
+COMMUNITIES_RANKING_WEIGHTS = {
+    'records': 1.0,
+    'requests': 0.5,
+    'acceptances': 5.0,
+    'recency': 100.0,
+    'fixed_points': 1.0,
+}
+"""Weights of the activity signals in the ranking of the communities.
+
+* ``records``: per accepted record.
+* ``requests``: per pending inclusion request.
+* ``acceptances``: per record accepted during ``COMMUNITIES_RANKING_PERIOD``.
+* ``recency``: for a record accepted just now, decreasing linearly to zero
+  at the end of ``COMMUNITIES_RANKING_PERIOD``.
+* ``fixed_points``: per fixed point of the community.
+"""
+
+COMMUNITIES_REST_CACHE = 'invenio_communities.cache:LRUCache'
+"""Cache of the REST list responses, or ``None`` to disable it.
+
+An import path or a function returning an object with the interface of the
+werkzeug caches, e.g. ``lambda: RedisCache(key_prefix='communities_')``.
+The entries are invalidated in all the processes when the communities are
+modified, through the generation of the communities.
+"""
+
+COMMUNITIES_REST_CACHE_TIMEOUT = 60
+"""Time to live of the cached REST list responses, in seconds."""
+
+COMMUNITIES_PAGE_CACHE = None
+"""Cache of the UI pages of the anonymous users, or ``None`` to disable it.
+
+Same as ``COMMUNITIES_REST_CACHE``, e.g.
+``'invenio_communities.cache:LRUCache'``. The index, detail and about pages
+are cached by URL and locale.
+"""
+
+COMMUNITIES_PAGE_CACHE_TIMEOUT = 300
+"""Time to live of the cached UI pages, in seconds."""
+
+COMMUNITIES_PAGE_CACHE_MAX_AGE = 60
+"""Time during which browsers and proxies may reuse the cached UI pages.
+
+In seconds, sent in the ``Cache-Control`` header of the pages of the
+anonymous users when the page cache is enabled.
+"""
+
+COMMUNITIES_OBJECT_CACHE = None
+"""Cache of the communities loaded by the UI views, or ``None`` to disable.
+
+Same as ``COMMUNITIES_REST_CACHE``. The unknown communities are cached too,
+so that probing them does not reach the database.
+"""
+
+COMMUNITIES_OBJECT_CACHE_TIMEOUT = 300
+"""Time to live of the cached communities, in seconds."""
+
+COMMUNITIES_RANKING_PERIOD = timedelta(days=90)
+"""Period during which the record acceptances count for the ranking."""
+
+COMMUNITIES_COUNTER_SHARDS = 8
+"""Number of rows over which the counters of a community are spread."""
+
 COMMUNITIES_LOGO_EXTENSIONS = ['png', 'jpg', 'jpeg', 'svg']
 """Allowed file extensions for the communities logo."""
 
@@ -50,11 +130,32 @@ COMMUNITIES_LOGO_MAX_SIZE = 1000 * 1000 * 1.5  # 1.5 MB
 COMMUNITIES_RECORD_KEY = 'communities'
 """Key inside the JSON record for communities."""
 
+COMMUNITIES_INDEX_MEMBERSHIP = False
+"""Index the communities of the records from the membership table.
+
+If ``True``, the communities key of the indexed records is built from the
+``communities_community_membership`` table instead of the record JSON. Run
+``communities backfill-membership`` before enabling it.
+"""
+
 COMMUNITIES_SORTING_OPTIONS = [
     'title',
     'ranking',
+    'relevance',
 ]
-"""Possible communities sorting options."""
+"""Possible communities sorting options.
+
+Sorting by ``relevance`` requires ``COMMUNITIES_INDEXED_SEARCH``, otherwise
+it falls back to ``ranking``.
+"""
+
+COMMUNITIES_INDEXED_SEARCH = False
+"""Use indexes to search communities.
+
+On PostgreSQL the full-text and trigram (``pg_trgm``) indexes are used, on
+other databases the words are looked up in the ``communities_community_term``
+inverted index table. By default, the pattern is matched with ``LIKE``.
+"""
 
 COMMUNITIES_DEFAULT_SORTING_OPTION = 'ranking'
 """Default sorting option."""
@@ -57,5 +57,9 @@ class InclusionRequestObsoleteError(CommunityRecordError):
     """Record already belongs to a community."""
 
 
+class CommunityRecordMissingError(CommunityRecordError):
+    """Record does not belong to the community."""
+
+
 class InclusionRequestExpiryTimeError(CommunityRecordError):
     """Incorrect expiry time for inclusion request."""
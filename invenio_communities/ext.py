@@ -26,19 +26,28 @@
 
 from __future__ import absolute_import, print_function
 
+from flask import current_app
+from invenio_access.models import ActionRoles, ActionUsers
 from invenio_indexer.signals import before_record_index
-from sqlalchemy.event import listen
-from werkzeug.utils import cached_property
+from sqlalchemy.event import contains, listen
+from sqlalchemy.orm import Session
+from werkzeug.utils import cached_property, import_string
 
 from . import config
 from .cli import communities as cmd
-from .models import Community
+from .models import Community, FeaturedCommunity, InclusionRequest
 from .permissions import (admin_permission_factory,
                           read_permission_factory,
                           manage_permission_factory,
                           curate_permission_factory)
-from .receivers import create_oaipmh_set, destroy_oaipmh_set, \
-    inject_provisional_community, new_request
+from .receivers import bump_generation_before_commit, create_oaipmh_set, \
+    delete_community_terms, destroy_oaipmh_set, discard_counters, \
+    discard_invalidation, discard_scheduled_records, \
+    forget_generation_after_commit, index_community_terms, \
+    index_scheduled_records_after_commit, \
+    index_scheduled_records_before_commit, inject_communities, \
+    inject_provisional_community, invalidate_communities_cache, \
+    invalidate_permissions_cache, new_request, write_counters_before_commit
 from .signals import inclusion_request_created
 
 
@@ -47,6 +56,10 @@ class InvenioCommunities(object):
 
     def __init__(self, app=None):
         """Extension initialization."""
+        self.oaiset_ids = {}
+        """Cache of the OAISet primary keys indexed by community ID."""
+        self.featured_community = None
+        """Featured community cached by ``get_featured_community``."""
         if app:
             self.init_app(app)
 
@@ -62,10 +75,34 @@ class InvenioCommunities(object):
     def register_signals(self, app):
         """Register the signals."""
         before_record_index.connect(inject_provisional_community)
+        before_record_index.connect(inject_communities)
+        listen(Community, 'after_insert', index_community_terms)
+        listen(Community, 'after_update', index_community_terms)
+        listen(Community, 'before_delete', delete_community_terms)
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            for model, receiver in (
+                    (Community, invalidate_communities_cache),
+                    (FeaturedCommunity, invalidate_communities_cache),
+                    (InclusionRequest, invalidate_communities_cache),
+                    (ActionUsers, invalidate_permissions_cache),
+                    (ActionRoles, invalidate_permissions_cache)):
+                if not contains(model, name, receiver):
+                    listen(model, name, receiver)
         if app.config['COMMUNITIES_OAI_ENABLED']:
             listen(Community, 'after_insert', create_oaipmh_set)
             listen(Community, 'after_delete', destroy_oaipmh_set)
         inclusion_request_created.connect(new_request)
+        for name, receiver in (
+                ('before_commit', index_scheduled_records_before_commit),
+                ('after_commit', index_scheduled_records_after_commit),
+                ('after_transaction_end', discard_scheduled_records),
+                ('before_commit', write_counters_before_commit),
+                ('after_transaction_end', discard_counters),
+                ('before_commit', bump_generation_before_commit),
+                ('after_commit', forget_generation_after_commit),
+                ('after_transaction_end', discard_invalidation)):
+            if not contains(Session, name, receiver):
+                listen(Session, name, receiver)
 
     def init_config(self, app):
         """Initialize configuration."""
@@ -79,6 +116,31 @@ class InvenioCommunities(object):
             if k.startswith("COMMUNITIES_"):
                 app.config.setdefault(k, getattr(config, k))
 
+    @staticmethod
+    def load_cache(name):
+        """Create the cache set by a configuration variable."""
+        cache = current_app.config[name]
+        if cache is None:
+            return None
+        if not callable(cache):
+            cache = import_string(cache)
+        return cache()
+
+    @cached_property
+    def rest_cache(self):
+        """Cache of the REST list responses."""
+        return self.load_cache('COMMUNITIES_REST_CACHE')
+
+    @cached_property
+    def page_cache(self):
+        """Cache of the UI pages of the anonymous users."""
+        return self.load_cache('COMMUNITIES_PAGE_CACHE')
+
+    @cached_property
+    def object_cache(self):
+        """Cache of the communities loaded by the UI views."""
+        return self.load_cache('COMMUNITIES_OBJECT_CACHE')
+
     @cached_property
     def read_permission_factory(self):
         """Load default permission factory."""
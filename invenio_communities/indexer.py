@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Deferred indexing of the records touched by the communities."""
+
+from __future__ import absolute_import, print_function
+
+from contextlib import contextmanager
+from itertools import islice
+
+from flask import current_app, g
+from invenio_db import db
+from invenio_indexer.api import RecordIndexer
+
+from .models import CommunityMembership, InclusionRequest
+
+_SESSION_KEY = 'communities_reindex'
+
+
+class CommunityRecordIndexer(RecordIndexer):
+    """Record indexer prefetching the communities data of each batch.
+
+    The communities of the queued records are loaded with one query per
+    batch of messages instead of one query per record.
+    """
+
+    prefetch_size = 500
+    """Number of queued records whose data is prefetched at once."""
+
+    def _actionsiter(self, message_iterator):
+        """Iterate bulk actions, prefetching the data of each batch."""
+        message_iterator = iter(message_iterator)
+        parent = super(CommunityRecordIndexer, self)
+        while True:
+            batch = list(islice(message_iterator, self.prefetch_size))
+            if not batch:
+                break
+            payloads = [message.decode() for message in batch]
+            ids = [payload.get('id') for payload in payloads
+                   if payload.get('op') != 'delete' and payload.get('id')]
+            with prefetched_communities(ids):
+                for action in parent._actionsiter(batch):
+                    yield action
+
+
+def _communities_by_record(model, record_ids):
+    """Load the community IDs of many records from an association table."""
+    result = dict((id_, []) for id_ in record_ids)
+    if result:
+        rows = db.session.query(model.id_record, model.id_community).filter(
+            model.id_record.in_(list(result.keys())))
+        for id_record, id_community in rows:
+            result[str(id_record)].append(id_community)
+    return result
+
+
+@contextmanager
+def prefetched_communities(record_ids):
+    """Load the communities data of many records with one query per table.
+
+    While the context is active, ``get_provisional_communities`` and
+    ``get_record_communities`` do not query the database for these records.
+
+    :param record_ids: Iterable of record UUIDs.
+    """
+    record_ids = [str(id_) for id_ in record_ids]
+    cache = {
+        InclusionRequest: _communities_by_record(InclusionRequest, record_ids),
+    }
+    if current_app.config['COMMUNITIES_INDEX_MEMBERSHIP']:
+        cache[CommunityMembership] = _communities_by_record(
+            CommunityMembership, record_ids)
+    previous = getattr(g, '_communities_prefetched', None)
+    g._communities_prefetched = cache
+    try:
+        yield cache
+    finally:
+        g._communities_prefetched = previous
+
+
+def _get_communities(model, record_id):
+    """Get the sorted community IDs of a record from an association table."""
+    cache = (getattr(g, '_communities_prefetched', None) or {}).get(model)
+    if cache is not None and str(record_id) in cache:
+        return sorted(cache[str(record_id)])
+    return sorted(r.id_community for r in model.get_by_record(record_id))
+
+
+def get_provisional_communities(record_id):
+    """Get the sorted IDs of the communities a record is pending in.
+
+    :param record_id: Record UUID.
+    """
+    return _get_communities(InclusionRequest, record_id)
+
+
+def get_record_communities(record_id):
+    """Get the sorted IDs of the communities a record is member of.
+
+    :param record_id: Record UUID.
+    """
+    return _get_communities(CommunityMembership, record_id)
+
+
+def reindex_records(ids, session=None):
+    """Index records once the current transaction is committed.
+
+    A record scheduled several times in a transaction is indexed only once.
+    Nothing is indexed if the transaction is rolled back.
+
+    :param ids: Iterable of record UUIDs.
+    :param session: SQLAlchemy session (defaults to ``db.session``).
+    """
+    session = session or db.session
+    session.info.setdefault(_SESSION_KEY, set()).update(ids)
+
+
+def pop_scheduled_records(session):
+    """Get and forget the records scheduled for indexing in a session."""
+    return session.info.pop(_SESSION_KEY, set())
+
+
+def index_records(ids):
+    """Index records, through the bulk queue unless configured otherwise.
+
+    :param ids: Iterable of record UUIDs.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    indexer = CommunityRecordIndexer()
+    if current_app.config['COMMUNITIES_REINDEX_ASYNC']:
+        indexer.bulk_index(ids)
+    else:
+        with prefetched_communities(ids):
+            for id_ in ids:
+                indexer.index_by_id(id_)
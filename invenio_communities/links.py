@@ -27,28 +27,57 @@
 from __future__ import absolute_import, print_function
 
 from flask import current_app, request, url_for
+from werkzeug.urls import url_quote
+
+_ID_PLACEHOLDER = '__community_id__'
 
 
 def default_links_item_factory(community):
     """Factory for record links generation."""
-    return dict(
-        self=url_for(
-            '.communities_item', community_id=community['id'], _external=True),
-        html=current_app.config.get(
-            'COMMUNITIES_URL_COMMUNITY_VIEW',
-            '{protocol}://{host}/communities/{community_id}/'
-        ).format(
-            protocol=request.environ['wsgi.url_scheme'],
-            host=request.environ['HTTP_HOST'],
-            community_id=community['id']
-        )
+    return build_links_item_factory()(community)
+
+
+def build_links_item_factory():
+    """Build a record links factory from URL templates computed once.
+
+    Used when serializing many communities, so that ``url_for`` is called
+    once per response instead of once per community.
+    """
+    self_template = url_for(
+        '.communities_item', community_id=_ID_PLACEHOLDER, _external=True)
+    html_template = current_app.config.get(
+        'COMMUNITIES_URL_COMMUNITY_VIEW',
+        '{protocol}://{host}/communities/{community_id}/'
+    ).format(
+        protocol=request.environ['wsgi.url_scheme'],
+        host=request.environ['HTTP_HOST'],
+        community_id=_ID_PLACEHOLDER
     )
 
+    def links_item_factory(community):
+        """Factory for record links generation."""
+        return dict(
+            self=self_template.replace(
+                _ID_PLACEHOLDER, url_quote(community['id'])),
+            html=html_template.replace(_ID_PLACEHOLDER, community['id']),
+        )
+    return links_item_factory
+
 
 def default_links_pagination_factory(page, urlkwargs):
     """Factory for record links generation."""
     endpoint = '.communities_list'
 
+    if hasattr(page, 'next_cursor'):
+        links = {
+            'self': url_for(endpoint, cursor=page.cursor or '',
+                            _external=True, **urlkwargs),
+        }
+        if page.next_cursor:
+            links['next'] = url_for(endpoint, cursor=page.next_cursor,
+                                    _external=True, **urlkwargs)
+        return links
+
     links = {
         'self': url_for(endpoint, page=page.page, _external=True, **urlkwargs),
     }
@@ -27,21 +27,26 @@
 from __future__ import absolute_import, print_function
 
 import hashlib
+import random
+import re
+from collections import namedtuple
 from datetime import datetime
 
 from flask import current_app, url_for
-from invenio_accounts.models import User
+from invenio_access.models import ActionRoles, ActionUsers
+from invenio_accounts.models import Role, User
 from invenio_db import db
 from invenio_records.api import Record
 from invenio_records.models import RecordMetadata
+from sqlalchemy import DDL, event
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import FlushError
 from sqlalchemy_utils.models import Timestamp
 from sqlalchemy_utils.types import UUIDType
 
-from .errors import CommunitiesError, InclusionRequestExistsError, \
-    InclusionRequestExpiryTimeError, InclusionRequestMissingError, \
-    InclusionRequestObsoleteError
+from .errors import CommunitiesError, CommunityRecordMissingError, \
+    InclusionRequestExistsError, InclusionRequestExpiryTimeError, \
+    InclusionRequestMissingError, InclusionRequestObsoleteError
 from .signals import inclusion_request_created
 from .utils import save_and_validate_logo
 
@@ -65,7 +70,8 @@ class InclusionRequest(db.Model, Timestamp):
     id_record = db.Column(
         UUIDType,
         db.ForeignKey(RecordMetadata.id),
-        primary_key=True
+        primary_key=True,
+        index=True,
     )
     """Id of the record applying to given community."""
 
@@ -73,7 +79,8 @@ class InclusionRequest(db.Model, Timestamp):
         db.Integer,
         db.ForeignKey(User.id),
         nullable=True,
-        default=None
+        default=None,
+        index=True,
     )
     """User making the request (optional)."""
 
@@ -81,6 +88,7 @@ class InclusionRequest(db.Model, Timestamp):
         db.DateTime,
         nullable=True,
         default=None,
+        index=True,
     )
     """Expiry date of the record request."""
 
@@ -106,6 +114,7 @@ class InclusionRequest(db.Model, Timestamp):
     def delete(self):
         """Delete this request."""
         db.session.delete(self)
+        CommunityCounter.increment(self.id_community, requests=-1)
 
     @classmethod
     def create(cls, community, record, user=None, expires_at=None,
@@ -115,8 +124,13 @@ class InclusionRequest(db.Model, Timestamp):
         :param community: Community object.
         :param record: Record API object.
         :param expires_at: Time after which the request expires and shouldn't
-            be resolved anymore.
+            be resolved anymore. Defaults to the current time plus
+            ``COMMUNITIES_REQUEST_EXPIRY_TIME``.
         """
+        if expires_at is None and \
+                current_app.config['COMMUNITIES_REQUEST_EXPIRY_TIME']:
+            expires_at = datetime.utcnow() + \
+                current_app.config['COMMUNITIES_REQUEST_EXPIRY_TIME']
         if expires_at and expires_at < datetime.utcnow():
             raise InclusionRequestExpiryTimeError(
                 community=community, record=record)
@@ -139,6 +153,8 @@ class InclusionRequest(db.Model, Timestamp):
             raise InclusionRequestExistsError(
                 community=community, record=record)
 
+        CommunityCounter.increment(community.id, requests=1)
+
         # Send signal
         inclusion_request_created.send(
             current_app._get_current_object(),
@@ -160,32 +176,72 @@ class InclusionRequest(db.Model, Timestamp):
         """Get inclusion requests for a given record."""
         return cls.query.filter_by(id_record=record_uuid)
 
+    @classmethod
+    def delete_expired(cls, now, limit):
+        """Delete a chunk of the requests expired at a given time.
+
+        The oldest expired requests are selected through the ``expires_at``
+        index and deleted by primary key.
+
+        :param now: Time at which the requests are expired.
+        :param limit: Maximum number of requests to delete.
+        :returns: Set of the UUIDs of the records whose requests were deleted.
+        """
+        rows = db.session.query(cls.id_community, cls.id_record).filter(
+            cls.expires_at < now
+        ).order_by(cls.expires_at).limit(limit).all()
+        by_community = {}
+        for id_community, id_record in rows:
+            by_community.setdefault(id_community, []).append(id_record)
+        if by_community:
+            cls.query.filter(
+                cls.expires_at < now,
+                db.or_(*[db.and_(cls.id_community == id_community,
+                                 cls.id_record.in_(ids))
+                         for id_community, ids in by_community.items()]),
+            ).delete(synchronize_session=False)
+        for id_community, ids in by_community.items():
+            CommunityCounter.increment(id_community, requests=-len(ids))
+        return set(id_record for _, id_record in rows)
+
 
 class Community(db.Model, Timestamp):
     """Represent a community."""
 
     __tablename__ = 'communities_community'
 
+    __table_args__ = (
+        db.Index('ix_communities_community_deleted_at_ranking',
+                 'deleted_at', 'ranking'),
+        db.Index('ix_communities_community_deleted_at_title',
+                 'deleted_at', 'title'),
+    )
+
     id = db.Column(db.String(100), primary_key=True)
     """Id of the community."""
 
     id_user = db.Column(
         db.Integer,
         db.ForeignKey(User.id),
-        nullable=False
+        nullable=False,
+        index=True,
     )
     """Owner of the community."""
 
     title = db.Column(db.String(length=255), nullable=False, default='')
     """Title of the community."""
 
-    description = db.Column(db.Text, nullable=False, default='')
+    description = db.deferred(
+        db.Column(db.Text, nullable=False, default=''), group='page_content')
     """Short description of community, displayed in portal boxes."""
 
-    page = db.Column(db.Text, nullable=False, default='')
+    page = db.deferred(
+        db.Column(db.Text, nullable=False, default=''), group='page_content')
     """Long description of community, displayed on an individual page."""
 
-    curation_policy = db.Column(db.Text(), nullable=False, default='')
+    curation_policy = db.deferred(
+        db.Column(db.Text(), nullable=False, default=''),
+        group='page_content')
     """Community curation policy."""
 
     last_record_accepted = db.Column(
@@ -196,7 +252,7 @@ class Community(db.Model, Timestamp):
     """Extension of the logo."""
 
     ranking = db.Column(db.Integer, nullable=False, default=0)
-    """Ranking of community. Updated by ranking deamon."""
+    """Ranking of community. Updated by the ranking task."""
 
     fixed_points = db.Column(db.Integer, nullable=False, default=0)
     """Points which will be always added to overall score of community."""
@@ -232,13 +288,24 @@ class Community(db.Model, Timestamp):
         return False
 
     @classmethod
-    def get(cls, community_id, with_deleted=False):
-        """Get a community."""
-        q = cls.query.filter_by(id=community_id)
+    def get(cls, community_id, with_deleted=False, options=()):
+        """Get a community.
+
+        :param options: Query options, e.g. to defer columns.
+        """
+        q = cls.query.options(*options).filter_by(id=community_id)
         if not with_deleted:
             q = q.filter(cls.deleted_at.is_(None))
         return q.one_or_none()
 
+    @staticmethod
+    def with_page_content():
+        """Query option loading the description, page and curation policy.
+
+        These large text columns are deferred by default.
+        """
+        return db.undefer_group('page_content')
+
     @classmethod
     def get_by_user(cls, user_id, with_deleted=False):
         """Get a community."""
@@ -251,7 +318,7 @@ class Community(db.Model, Timestamp):
         return query.order_by(db.asc(Community.title))
 
     @classmethod
-    def filter_communities(cls, p, so, with_deleted=False):
+    def filter_communities(cls, p, so, with_deleted=False, identity=None):
         """Search for communities.
 
         Helper function which takes from database only those communities which
@@ -261,48 +328,188 @@ class Community(db.Model, Timestamp):
         Parameter 'page' is introduced to restrict results and return only
         slice of them for the current page. If page == 0 function will return
         all communities that match the pattern.
+
+        If an ``identity`` is given, only the communities it is allowed to
+        read are returned (see :meth:`filter_allowed`).
         """
         query = cls.query if with_deleted else \
             cls.query.filter(cls.deleted_at.is_(None))
 
-        if p:
+        if identity is not None:
+            query = cls.filter_allowed(query, 'communities-read', identity)
+
+        relevance = None
+        if p and current_app.config['COMMUNITIES_INDEXED_SEARCH']:
+            match, relevance = cls._indexed_search(p)
+            query = query.filter(match)
+        elif p:
             query = query.filter(db.or_(
                 cls.id.like("%" + p + "%"),
                 cls.title.like("%" + p + "%"),
                 cls.description.like("%" + p + "%"),
             ))
 
-        if so in current_app.config['COMMUNITIES_SORTING_OPTIONS']:
-            order = so == 'title' and db.asc or db.desc
-            query = query.order_by(order(getattr(cls, so)))
+        if so == 'relevance' and relevance is not None:
+            query = query.order_by(db.desc(relevance), db.desc(cls.ranking))
         else:
-            query = query.order_by(db.desc(cls.ranking))
+            column, descending = cls.sort_column(so)
+            query = query.order_by(
+                db.desc(column) if descending else db.asc(column))
         return query
 
-    def add_record(self, record):
+    @classmethod
+    def sort_column(cls, so):
+        """Get the column on which a sorting option orders the communities.
+
+        Unknown options and ``relevance`` fall back to the ranking.
+
+        :returns: Tuple of the column and whether the order is descending.
+        """
+        if so in current_app.config['COMMUNITIES_SORTING_OPTIONS'] and \
+                so != 'relevance':
+            return getattr(cls, so), so != 'title'
+        return cls.ranking, True
+
+    @classmethod
+    def _indexed_search(cls, p):
+        """Build the indexed search criterion for a pattern.
+
+        On PostgreSQL the full-text and trigram indexes of the communities
+        table are used, otherwise the words are looked up by prefix in the
+        :class:`CommunityTerm` inverted index.
+
+        :param p: Search pattern.
+        :returns: Tuple of the filter criterion and the relevance expression.
+        """
+        if db.engine.name == 'postgresql':
+            like = "%" + p + "%"
+            vector = db.func.to_tsvector(
+                'simple', cls.title + ' ' + cls.description)
+            tsquery = db.func.plainto_tsquery('simple', p)
+            match = db.or_(
+                vector.op('@@')(tsquery),
+                cls.id.ilike(like),
+                cls.title.ilike(like),
+            )
+            return match, db.func.ts_rank_cd(vector, tsquery)
+
+        terms = CommunityTerm.tokenize(p)
+        if not terms:
+            return db.false(), None
+
+        def term_match(term):
+            # Prefix match expressed as a range to be served by the index
+            return db.and_(CommunityTerm.term >= term,
+                           CommunityTerm.term < term + u'\uffff')
+
+        match = db.and_(*[
+            cls.id.in_(db.select([CommunityTerm.id_community]).where(
+                term_match(term)))
+            for term in terms
+        ])
+        relevance = db.select([db.func.count()]).where(db.and_(
+            CommunityTerm.id_community == cls.id,
+            db.or_(*[term_match(term) for term in terms]),
+        )).as_scalar()
+        return match, relevance
+
+    @classmethod
+    def filter_allowed(cls, query, action, identity):
+        """Restrict a query to the communities allowed for an identity.
+
+        The permission check is done in SQL and follows the semantics of
+        ``DynamicPermission``: if nobody is granted the action on a community
+        (neither for its ID nor globally) the community is allowed to
+        everybody, otherwise the identity needs a matching grant. Explicit
+        exclusions always take precedence, then the ``superuser-access``
+        grants allow every community.
+
+        :param query: Query on :class:`Community` to restrict.
+        :param action: Name of the parameterized action
+            (e.g. ``'communities-read'``).
+        :param identity: ``flask_principal.Identity`` to check.
+        :returns: The filtered query.
+        """
+        user_ids = [n.value for n in identity.provides if n.method == 'id']
+        role_names = [n.value for n in identity.provides if n.method == 'role']
+
+        def action_rows(model, name, exclude, *criteria):
+            argument = model.argument.is_(None)
+            if name == action:
+                argument = db.or_(model.argument == cls.id, argument)
+            return db.exists().where(db.and_(
+                model.action == name,
+                model.exclude.is_(exclude),
+                argument,
+                *criteria
+            ))
+
+        def identity_rows(name, exclude):
+            clauses = []
+            if user_ids:
+                clauses.append(action_rows(
+                    ActionUsers, name, exclude,
+                    ActionUsers.user_id.in_(user_ids)))
+            if role_names:
+                clauses.append(action_rows(
+                    ActionRoles, name, exclude, ActionRoles.role_id.in_(
+                        db.select([Role.id]).where(
+                            Role.name.in_(role_names)))))
+            return db.or_(*clauses) if clauses else db.false()
+
+        granted = db.or_(
+            action_rows(ActionUsers, action, False),
+            action_rows(ActionRoles, action, False),
+        )
+        return query.filter(
+            db.or_(~granted, identity_rows(action, False),
+                   identity_rows('superuser-access', False)),
+            ~identity_rows(action, True),
+        )
+
+    def add_record(self, record, user=None):
         """Add a record to the community.
 
         :param record: Record object.
         :type record: `invenio_records.api.Record`
+        :param user: User adding the record (optional).
         """
-        # first we try to remove the record from the pending area if exists
-        # useful if record added directly, but already submitted
-        try:
-            req = InclusionRequest.get(self.id, record.id)
-            req.delete()
-        except:  # the record was not in the pending area
-            pass
-        key = current_app.config['COMMUNITIES_RECORD_KEY']
-        record.setdefault(key, [])
+        self.add_records([record], user=user)
+
+    def add_records(self, records, user=None):
+        """Add many records to the community.
+
+        The pending inclusion requests of the records are removed, as it is
+        useful if records are added directly but already submitted.
 
-        assert self.id not in record[key]
-        record[key].append(self.id)
-        record[key] = sorted(record[key])
+        :param records: List of Record objects.
+        :param user: User adding the records (optional).
+        """
+        for req in self._get_requests(records).values():
+            req.delete()
+        self._add_records(records, user=user)
 
-        if current_app.config["COMMUNITIES_OAI_ENABLED"]:
-            from invenio_oaiserver.models import OAISet
-            oaiset = OAISet.query.filter_by(spec=self.oaiset_spec).one()
-            oaiset.add_record(record)
+    def _add_records(self, records, user=None):
+        """Add the community and its OAI set to many records."""
+        key = current_app.config['COMMUNITIES_RECORD_KEY']
+        oaiset = self.oaiset \
+            if current_app.config["COMMUNITIES_OAI_ENABLED"] else None
+        for record in records:
+            record.setdefault(key, [])
+
+            assert self.id not in record[key]
+            record[key].append(self.id)
+            record[key] = sorted(record[key])
+
+            if oaiset is not None:
+                oaiset.add_record(record)
+
+            db.session.add(CommunityMembership(
+                id_community=self.id,
+                id_record=record.id,
+                id_user=user.id if user else None,
+            ))
+        CommunityCounter.increment(self.id, records=len(records))
 
     def remove_record(self, record):
         """Remove an already accepted record from the community.
@@ -310,26 +517,38 @@ class Community(db.Model, Timestamp):
         :param record: Record object.
         :type record: `invenio_records.api.Record`
         """
+        self._remove_records([record])
+
+    def _remove_records(self, records):
+        """Remove the community and its OAI set from many records."""
         key = current_app.config['COMMUNITIES_RECORD_KEY']
+        oaiset = self.oaiset \
+            if current_app.config["COMMUNITIES_OAI_ENABLED"] else None
+        for record in records:
+            assert self.id in record.get(key, [])
 
-        assert self.id in record.get(key, [])
+            record[key] = [c for c in record[key] if c != self.id]
 
-        record[key] = [c for c in record[key] if c != self.id]
+            if oaiset is not None:
+                oaiset.remove_record(record)
 
-        if current_app.config["COMMUNITIES_OAI_ENABLED"]:
-            from invenio_oaiserver.models import OAISet
-            oaiset = OAISet.query.filter_by(spec=self.oaiset_spec).one()
-            oaiset.remove_record(record)
+        for membership in CommunityMembership.query.filter(
+                CommunityMembership.id_community == self.id,
+                CommunityMembership.id_record.in_(
+                    [record.id for record in records])):
+            db.session.delete(membership)
+        CommunityCounter.increment(self.id, records=-len(records))
 
     def has_record(self, record):
         """Check if record is in community."""
         return self.id in \
             record.get(current_app.config["COMMUNITIES_RECORD_KEY"], [])
 
-    def accept_record(self, record):
+    def accept_record(self, record, user=None):
         """Accept a record for inclusion in the community.
 
         :param record: Record object.
+        :param user: User accepting the record (optional).
         """
         with db.session.begin_nested():
             req = InclusionRequest.get(self.id, record.id)
@@ -337,7 +556,7 @@ class Community(db.Model, Timestamp):
                 raise InclusionRequestMissingError(community=self,
                                                    record=record)
             req.delete()
-            self.add_record(record)
+            self.add_record(record, user=user)
             self.last_record_accepted = datetime.utcnow()
 
     def reject_record(self, record):
@@ -352,6 +571,86 @@ class Community(db.Model, Timestamp):
                                                    record=record)
             req.delete()
 
+    def _get_requests(self, records):
+        """Get the inclusion requests of many records with one query."""
+        ids = [record.id for record in records]
+        if not ids:
+            return {}
+        return {req.id_record: req for req in InclusionRequest.query.filter(
+            InclusionRequest.id_community == self.id,
+            InclusionRequest.id_record.in_(ids),
+        )}
+
+    def accept_records(self, records, user=None):
+        """Accept many records for inclusion in the community.
+
+        The records which cannot be accepted are skipped.
+
+        :param records: List of Record objects.
+        :param user: User accepting the records (optional).
+        :returns: Dictionary of the errors indexed by record ID.
+        """
+        requests = self._get_requests(records)
+        errors = {}
+        accepted = []
+        with db.session.begin_nested():
+            for record in records:
+                req = requests.pop(record.id, None)
+                if req is None:
+                    errors[record.id] = InclusionRequestMissingError(
+                        community=self, record=record)
+                    continue
+                req.delete()
+                if self.has_record(record):
+                    errors[record.id] = InclusionRequestObsoleteError(
+                        community=self, record=record)
+                    continue
+                accepted.append(record)
+            if accepted:
+                self._add_records(accepted, user=user)
+                self.last_record_accepted = datetime.utcnow()
+        return errors
+
+    def reject_records(self, records):
+        """Reject many records for inclusion in the community.
+
+        The records without inclusion request are skipped.
+
+        :param records: List of Record objects.
+        :returns: Dictionary of the errors indexed by record ID.
+        """
+        requests = self._get_requests(records)
+        errors = {}
+        with db.session.begin_nested():
+            for record in records:
+                req = requests.pop(record.id, None)
+                if req is None:
+                    errors[record.id] = InclusionRequestMissingError(
+                        community=self, record=record)
+                    continue
+                req.delete()
+        return errors
+
+    def remove_records(self, records):
+        """Remove many already accepted records from the community.
+
+        The records which do not belong to the community are skipped.
+
+        :param records: List of Record objects.
+        :returns: Dictionary of the errors indexed by record ID.
+        """
+        errors = {}
+        removed = []
+        for record in records:
+            if not self.has_record(record):
+                errors[record.id] = CommunityRecordMissingError(
+                    community=self, record=record)
+                continue
+            removed.append(record)
+        if removed:
+            self._remove_records(removed)
+        return errors
+
     def delete(self):
         """Mark the community for deletion.
 
@@ -425,6 +724,28 @@ class Community(db.Model, Timestamp):
         return current_app.config['COMMUNITIES_OAI_FORMAT'].format(
             community_id=self.id)
 
+    @property
+    def counters(self):
+        """Return the records and requests counters of the community."""
+        return CommunityCounter.get_totals([self.id])[self.id]
+
+    @property
+    def oaiset(self):
+        """Return the OAISet of the community.
+
+        The primary key of the set is cached per application, so that the set
+        is usually found in the session without querying it by spec.
+        """
+        from invenio_oaiserver.models import OAISet
+        cache = current_app.extensions['invenio-communities'].oaiset_ids
+        spec = self.oaiset_spec
+        pk = cache.get(self.id)
+        oaiset = OAISet.query.get(pk) if pk is not None else None
+        if oaiset is None or oaiset.spec != spec:
+            oaiset = OAISet.query.filter_by(spec=spec).one()
+            cache[self.id] = oaiset.id
+        return oaiset
+
     @property
     def oaiset_url(self):
         """Return the OAISet 'spec' name for given community.
@@ -444,8 +765,26 @@ class Community(db.Model, Timestamp):
         :returns: hash which encodes the community id and its las update.
         :rtype: str
         """
+        return self.compute_version_id(self.id, self.updated)
+
+    @staticmethod
+    def compute_version_id(community_id, updated):
+        """Compute the version of a community from its id and last update."""
         return hashlib.sha1('{0}__{1}'.format(
-            self.id, self.updated).encode('utf-8')).hexdigest()
+            community_id, updated).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_updated(cls, community_id, with_deleted=False):
+        """Get the last update time of a community without loading it.
+
+        :returns: Tuple of the community id and last update time, or
+            ``None`` if the community does not exist.
+        """
+        q = db.session.query(cls.id, cls.updated).filter(
+            cls.id == community_id)
+        if not with_deleted:
+            q = q.filter(cls.deleted_at.is_(None))
+        return q.one_or_none()
 
 
 class FeaturedCommunity(db.Model, Timestamp):
@@ -461,7 +800,7 @@ class FeaturedCommunity(db.Model, Timestamp):
     """Id of the featured community."""
 
     start_date = db.Column(
-        db.DateTime, nullable=False, default=datetime.utcnow)
+        db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     """Start date of the community featuring."""
 
     #
@@ -474,15 +813,305 @@ class FeaturedCommunity(db.Model, Timestamp):
     def get_featured_or_none(cls, start_date=None):
         """Get the latest featured community.
 
+        The community is loaded with its description, which is displayed
+        with it, but without the rest of its page content.
+
         :param start_date: Date after which the featuring starts
         :returns: Community object or None
         :rtype: `invenio_communities.models.Community` or None
         """
         start_date = start_date or datetime.utcnow()
 
-        comm = cls.query.filter(
+        comm = cls.query.options(
+            db.joinedload(cls.community).undefer('description')
+        ).filter(
             FeaturedCommunity.start_date <= start_date
         ).order_by(
             cls.start_date.desc()
         ).first()
         return comm if comm is None else comm.community
+
+    @classmethod
+    def get_next_start_date(cls, start_date):
+        """Get the start date of the next featuring.
+
+        :param start_date: Date after which the featuring starts.
+        :returns: The start date, or ``None`` if no featuring is scheduled.
+        """
+        return db.session.query(db.func.min(cls.start_date)).filter(
+            cls.start_date > start_date).scalar()
+
+
+class CommunityMembership(db.Model):
+    """Association table for the records accepted in a community.
+
+    Kept in sync with the communities key of the records JSON, it allows to
+    check and count the members of a community without loading records.
+    """
+
+    __tablename__ = 'communities_community_membership'
+
+    id_community = db.Column(
+        db.String(100), db.ForeignKey(Community.id), primary_key=True)
+    """Id of the community."""
+
+    id_record = db.Column(
+        UUIDType,
+        db.ForeignKey(RecordMetadata.id),
+        primary_key=True,
+        index=True,
+    )
+    """Id of the record member of the community."""
+
+    accepted_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow)
+    """Date of the acceptance of the record."""
+
+    id_user = db.Column(
+        db.Integer, db.ForeignKey(User.id), nullable=True, default=None)
+    """User who accepted the record (optional)."""
+
+    #
+    # Relationships
+    #
+    community = db.relationship(Community, foreign_keys=[id_community])
+    """Relation to the community."""
+
+    record = db.relationship(RecordMetadata, foreign_keys=[id_record])
+    """Relation to the member record."""
+
+    accepted_by = db.relationship(User, foreign_keys=[id_user])
+    """Relation to the User who accepted the record."""
+
+    @classmethod
+    def get(cls, community_id, record_uuid):
+        """Get the membership of a record in a community."""
+        return cls.query.get((community_id, record_uuid))
+
+    @classmethod
+    def get_by_record(cls, record_uuid):
+        """Get the memberships of a given record."""
+        return cls.query.filter_by(id_record=record_uuid)
+
+    @classmethod
+    def get_by_community(cls, community_id):
+        """Get the memberships of a given community."""
+        return cls.query.filter_by(id_community=community_id)
+
+
+CommunityCounts = namedtuple(
+    'CommunityCounts', ['records', 'requests', 'last_activity'])
+"""Totals of the counters of a community."""
+
+
+class CommunityCounter(db.Model):
+    """Sharded counters of the records and requests of a community.
+
+    The changes of a transaction are aggregated and added to one random shard
+    at commit time, so that concurrent transactions on the same community do
+    not wait on a single row lock. The totals are the sums over the shards.
+    """
+
+    __tablename__ = 'communities_community_counter'
+
+    id_community = db.Column(
+        db.String(100), db.ForeignKey(Community.id), primary_key=True)
+    """Id of the community."""
+
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    """Number of the shard."""
+
+    records = db.Column(db.Integer, nullable=False, default=0)
+    """Delta of the number of accepted records."""
+
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    """Delta of the number of pending inclusion requests."""
+
+    last_activity = db.Column(db.DateTime, nullable=True, default=None)
+    """Time of the last change written to the shard."""
+
+    _session_key = 'communities_counters'
+
+    @classmethod
+    def increment(cls, community_id, records=0, requests=0, session=None):
+        """Add deltas to the counters of a community when committing.
+
+        :param community_id: ID of the community.
+        :param records: Delta of the number of accepted records.
+        :param requests: Delta of the number of pending requests.
+        :param session: SQLAlchemy session (defaults to ``db.session``).
+        """
+        session = session or db.session
+        deltas = session.info.setdefault(cls._session_key, {})
+        old_records, old_requests = deltas.get(community_id, (0, 0))
+        deltas[community_id] = (old_records + records,
+                                old_requests + requests)
+
+    @classmethod
+    def discard_deltas(cls, session):
+        """Forget the deltas of a session."""
+        return session.info.pop(cls._session_key, None)
+
+    @classmethod
+    def write_deltas(cls, session):
+        """Add the deltas of a session to a random shard per community."""
+        deltas = cls.discard_deltas(session)
+        if not deltas:
+            return
+        session.flush()
+        now = datetime.utcnow()
+        shards = current_app.config['COMMUNITIES_COUNTER_SHARDS']
+        table = cls.__table__
+        for community_id, (records, requests) in deltas.items():
+            if not records and not requests:
+                continue
+            shard = random.randrange(shards)
+            update = table.update().where(db.and_(
+                table.c.id_community == community_id,
+                table.c.shard == shard,
+            )).values(
+                records=table.c.records + records,
+                requests=table.c.requests + requests,
+                last_activity=now,
+            )
+            if session.execute(update).rowcount:
+                continue
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(
+                        id_community=community_id, shard=shard,
+                        records=records, requests=requests,
+                        last_activity=now))
+            except IntegrityError:  # created by a concurrent transaction
+                session.execute(update)
+
+    @classmethod
+    def get_totals(cls, community_ids):
+        """Get the counters of many communities with one query.
+
+        :param community_ids: List of community IDs.
+        :returns: Dictionary of ``CommunityCounts`` indexed by community ID.
+        """
+        result = dict(
+            (id_, CommunityCounts(0, 0, None)) for id_ in community_ids)
+        if result:
+            rows = db.session.query(
+                cls.id_community,
+                db.func.sum(cls.records),
+                db.func.sum(cls.requests),
+                db.func.max(cls.last_activity),
+            ).filter(
+                cls.id_community.in_(list(result.keys()))
+            ).group_by(cls.id_community)
+            for id_community, records, requests, last_activity in rows:
+                result[id_community] = CommunityCounts(
+                    int(records or 0), int(requests or 0), last_activity)
+        return result
+
+
+class CommunityGeneration(db.Model):
+    """Generation of the communities data, shared by all the processes.
+
+    It is incremented by the transactions modifying the communities, their
+    featuring, inclusion requests or permissions. The caches of these data
+    check with one primary key read whether their entries are still valid.
+    """
+
+    __tablename__ = 'communities_generation'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    """Id of the generation, only one row is used."""
+
+    generation = db.Column(db.BigInteger, nullable=False, default=0)
+    """Number of the committed transactions modifying the data."""
+
+    _id = 1
+
+    @classmethod
+    def get(cls):
+        """Get the current generation."""
+        generation = db.session.query(cls.generation).filter(
+            cls.id == cls._id).scalar()
+        return generation or 0
+
+    @classmethod
+    def bump(cls, session):
+        """Increment the generation in the transaction of a session."""
+        table = cls.__table__
+        update = table.update().where(table.c.id == cls._id).values(
+            generation=table.c.generation + 1)
+        if session.execute(update).rowcount:
+            return
+        try:
+            with session.begin_nested():
+                session.execute(table.insert().values(
+                    id=cls._id, generation=1))
+        except IntegrityError:  # created by a concurrent transaction
+            session.execute(update)
+
+
+class CommunityTerm(db.Model):
+    """Inverted index of the words of the communities.
+
+    Portable alternative to the PostgreSQL full-text search used when
+    ``COMMUNITIES_INDEXED_SEARCH`` is enabled. It is kept in sync with the
+    identifier, title and description of the communities.
+    """
+
+    __tablename__ = 'communities_community_term'
+
+    id_community = db.Column(
+        db.String(100), db.ForeignKey(Community.id), primary_key=True)
+    """Id of the community."""
+
+    term = db.Column(db.String(64), primary_key=True, index=True)
+    """Lower-cased word of the community."""
+
+    _word_re = re.compile(r'\w+', re.UNICODE)
+    _tag_re = re.compile(r'<[^>]*>')
+
+    @classmethod
+    def tokenize(cls, text):
+        """Split a text into the set of its indexed terms."""
+        text = cls._tag_re.sub(' ', text or '')
+        return set(w[:64] for w in cls._word_re.findall(text.lower()))
+
+    @classmethod
+    def terms_for(cls, community):
+        """Get the indexed terms of a community."""
+        return cls.tokenize(u' '.join([
+            community.id or '',
+            community.title or '',
+            community.description or '',
+        ]))
+
+
+class CommunityDeletion(db.Model, Timestamp):
+    """Progress of the hard deletion of a community.
+
+    Allows a deletion interrupted by a worker restart to resume after the
+    last processed record instead of starting over.
+    """
+
+    __tablename__ = 'communities_community_deletion'
+
+    id_community = db.Column(
+        db.String(100), db.ForeignKey(Community.id), primary_key=True)
+    """Id of the community being deleted."""
+
+    last_record_id = db.Column(UUIDType, nullable=True, default=None)
+    """Id of the last record stripped of the community."""
+
+
+for _ddl in (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX ix_communities_community_fts '
+    'ON communities_community USING gin '
+    "(to_tsvector('simple', title || ' ' || description))",
+    'CREATE INDEX ix_communities_community_id_trgm '
+    'ON communities_community USING gin (id gin_trgm_ops)',
+    'CREATE INDEX ix_communities_community_title_trgm '
+    'ON communities_community USING gin (title gin_trgm_ops)',
+):
+    event.listen(Community.__table__, 'after_create',
+                 DDL(_ddl).execute_if(dialect='postgresql'))
@@ -24,8 +24,14 @@
 
 """Permissions for communities."""
 from functools import partial
+
+from flask import g
+from flask_principal import AnonymousIdentity
+from invenio_access.models import ActionRoles, ActionUsers
 from invenio_access.permissions import (DynamicPermission,
                                         ParameterizedActionNeed)
+from invenio_accounts.models import Role
+from invenio_db import db
 
 
 CommunityAdminActionNeed = partial(ParameterizedActionNeed, 'communities-admin')
@@ -67,3 +73,160 @@ communities_curate = CommunityCurateActionNeed(None)
 def curate_permission_factory(community):
     """Factory for creating curate permissions for communities."""
     return DynamicPermission(CommunityCurateActionNeed(str(community.id)))
+
+
+def identity_for_read_filter():
+    """Return the identity to filter the readable communities with.
+
+    Administrators can read every community, in which case ``None`` is
+    returned and no filtering should be applied.
+    """
+    permissions = get_community_permissions()
+    if permissions.can('admin-access'):
+        return None
+    return permissions.identity
+
+
+class CommunityPermissions(object):
+    """Request-scoped evaluator of the communities permissions.
+
+    All the grants and exclusions held by an identity on the communities
+    actions are loaded with a single query. Which communities are restricted
+    (i.e. have at least one grant for an action) is loaded in batches with
+    :meth:`prefetch`, so that permission checks are answered with set
+    lookups. The semantics are the ones of ``DynamicPermission``.
+    """
+
+    actions = (
+        'communities-admin',
+        'communities-read',
+        'communities-manage',
+        'communities-curate',
+        'admin-access',
+        'superuser-access',
+    )
+    """Actions evaluated by the permissions."""
+
+    prefetch_size = 500
+    """Maximum number of communities fetched per query."""
+
+    def __init__(self, identity):
+        """Load the grants and exclusions of the identity."""
+        self.identity = identity
+        self._granted = set()
+        self._excluded = set()
+        self._restricted = set()
+        self._prefetched = set()
+        self._globals_loaded = False
+
+        user_ids = [n.value for n in identity.provides if n.method == 'id']
+        role_names = [
+            n.value for n in identity.provides if n.method == 'role']
+
+        selects = []
+        if user_ids:
+            selects.append(db.select([
+                ActionUsers.action, ActionUsers.argument, ActionUsers.exclude
+            ]).where(db.and_(
+                ActionUsers.action.in_(self.actions),
+                ActionUsers.user_id.in_(user_ids),
+            )))
+        if role_names:
+            selects.append(db.select([
+                ActionRoles.action, ActionRoles.argument, ActionRoles.exclude
+            ]).where(db.and_(
+                ActionRoles.action.in_(self.actions),
+                ActionRoles.role_id.in_(db.select([Role.id]).where(
+                    Role.name.in_(role_names))),
+            )))
+        if selects:
+            for action, argument, exclude in db.session.execute(
+                    db.union_all(*selects)):
+                (self._excluded if exclude else self._granted).add(
+                    (action, argument))
+
+    def prefetch(self, communities):
+        """Load which of the given communities are restricted.
+
+        :param communities: Iterable of communities or community IDs.
+        """
+        ids = set(str(getattr(c, 'id', c)) for c in communities)
+        ids = list(ids - self._prefetched)
+        while ids or not self._globals_loaded:
+            chunk, ids = ids[:self.prefetch_size], ids[self.prefetch_size:]
+            self._load_restricted(chunk)
+            self._prefetched.update(chunk)
+
+    def _load_restricted(self, arguments):
+        """Load the granted actions on the given arguments."""
+        selects = []
+        for model in (ActionUsers, ActionRoles):
+            argument = model.argument.in_(arguments) if arguments \
+                else db.false()
+            if not self._globals_loaded:
+                argument = db.or_(argument, model.argument.is_(None))
+            selects.append(db.select([
+                model.action, model.argument
+            ]).where(db.and_(
+                model.action.in_(self.actions),
+                model.exclude.is_(False),
+                argument,
+            )))
+        self._restricted.update(
+            (action, argument) for action, argument in db.session.execute(
+                db.union(*selects)))
+        self._globals_loaded = True
+
+    def can(self, action, community=None):
+        """Check if the identity can perform an action.
+
+        :param action: Name of the action (e.g. ``'communities-read'``).
+        :param community: Community (or its ID) on which the action is
+            performed, ``None`` for non-parameterized actions.
+        """
+        keys = {(action, None)}
+        if community:
+            argument = str(getattr(community, 'id', community))
+            keys.add((action, argument))
+            self.prefetch([argument])
+        else:
+            self.prefetch([])
+
+        if keys & self._excluded:
+            return False
+        if ('superuser-access', None) in self._granted:
+            return True
+        if keys & self._restricted:
+            return bool(keys & self._granted)
+        return True
+
+    def permission(self, action, community=None):
+        """Return a permission-like object answered by this evaluator."""
+        return _EvaluatedPermission(self, action, community)
+
+
+class _EvaluatedPermission(object):
+    """Permission-like object backed by :class:`CommunityPermissions`."""
+
+    def __init__(self, evaluator, action, community):
+        """Initialize the permission."""
+        self.evaluator = evaluator
+        self.action = action
+        self.community = community
+
+    def can(self):
+        """Check if the permission is granted."""
+        return self.evaluator.can(self.action, self.community)
+
+
+def get_community_permissions():
+    """Return the communities permissions evaluator of the current request.
+
+    The evaluator is memoized on ``flask.g`` for the current identity.
+    """
+    identity = getattr(g, 'identity', None) or AnonymousIdentity()
+    evaluator = getattr(g, '_communities_permissions', None)
+    if evaluator is None or evaluator.identity is not identity:
+        evaluator = g._communities_permissions = CommunityPermissions(
+            identity)
+    return evaluator
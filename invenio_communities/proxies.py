@@ -32,7 +32,8 @@ from werkzeug.local import LocalProxy
 from .permissions import (CommunityAdminActionNeed,
                           CommunityReadActionNeed,
                           CommunityManageActionNeed,
-                          CommunityCurateActionNeed)
+                          CommunityCurateActionNeed,
+                          get_community_permissions)
 
 current_permission_factory = {
     "communities-admin": LocalProxy(lambda:
@@ -51,3 +52,6 @@ needs = {
     "communities-manage": CommunityManageActionNeed,
     "communities-curate": CommunityCurateActionNeed
 }
+
+current_permissions = LocalProxy(get_community_permissions)
+"""Permissions evaluator of the current request."""
@@ -28,8 +28,15 @@ from __future__ import absolute_import, print_function
 
 from flask import current_app
 from invenio_db import db
+from sqlalchemy import inspect
 
-from .models import InclusionRequest
+from .cache import forget_generation, invalidate_communities, is_invalidated, \
+    pop_invalidation
+from .indexer import get_provisional_communities, get_record_communities, \
+    index_records, pop_scheduled_records
+from .models import Community, CommunityCounter, CommunityGeneration, \
+    CommunityTerm
+from .permissions import CommunityPermissions
 from .utils import send_community_request_email
 
 
@@ -46,14 +53,27 @@ def inject_provisional_community(sender, json=None, record=None, index=None,
             current_app.config['COMMUNITIES_INDEX_PREFIX']):
         return
 
-    json['provisional_communities'] = list(sorted([
-        r.id_community for r in InclusionRequest.get_by_record(record.id)
-    ]))
+    json['provisional_communities'] = get_provisional_communities(record.id)
+
+
+def inject_communities(sender, json=None, record=None, index=None,
+                       **kwargs):
+    """Inject the communities of the membership table to ES index."""
+    if not current_app.config['COMMUNITIES_INDEX_MEMBERSHIP']:
+        return
+    if index and not index.startswith(
+            current_app.config['COMMUNITIES_INDEX_PREFIX']):
+        return
+
+    json[current_app.config['COMMUNITIES_RECORD_KEY']] = \
+        get_record_communities(record.id)
 
 
 def create_oaipmh_set(mapper, connection, community):
     """Signal for creating OAI-PMH sets during community creation."""
     from invenio_oaiserver.models import OAISet
+    current_app.extensions['invenio-communities'].oaiset_ids.pop(
+        community.id, None)
     with db.session.begin_nested():
         obj = OAISet(spec=community.oaiset_spec,
                      name=community.title,
@@ -64,6 +84,8 @@ def create_oaipmh_set(mapper, connection, community):
 def destroy_oaipmh_set(mapper, connection, community):
     """Signal for creating OAI-PMH sets during community creation."""
     from invenio_oaiserver.models import OAISet
+    current_app.extensions['invenio-communities'].oaiset_ids.pop(
+        community.id, None)
     with db.session.begin_nested():
         oaiset = OAISet.query.filter_by(
             spec=community.oaiset_spec).one_or_none()
@@ -71,3 +93,104 @@ def destroy_oaipmh_set(mapper, connection, community):
             raise Exception(
                 "OAISet for community {0} is missing".format(community.id))
         db.session.delete(oaiset)
+
+
+def index_community_terms(mapper, connection, community):
+    """Signal for updating the inverted index of the community words."""
+    state = inspect(community)
+    if not any(state.attrs[key].history.has_changes()
+               for key in ('id', 'title', 'description')):
+        return
+    # Read the flushed values, as the description may not be loaded.
+    columns = Community.__table__.c
+    row = connection.execute(db.select(
+        [columns.id, columns.title, columns.description]
+    ).where(columns.id == community.id)).first()
+    table = CommunityTerm.__table__
+    connection.execute(
+        table.delete().where(table.c.id_community == community.id))
+    terms = CommunityTerm.terms_for(row)
+    if terms:
+        connection.execute(table.insert(), [
+            dict(id_community=community.id, term=term) for term in terms])
+
+
+def delete_community_terms(mapper, connection, community):
+    """Signal for removing the community words from the inverted index."""
+    table = CommunityTerm.__table__
+    connection.execute(
+        table.delete().where(table.c.id_community == community.id))
+
+
+def index_scheduled_records_before_commit(session):
+    """Index synchronously the records scheduled in the transaction."""
+    if 'communities_reindex' not in session.info or \
+            current_app.config['COMMUNITIES_REINDEX_ASYNC']:
+        return
+    transaction = session.transaction
+    if transaction is not None and transaction.nested:
+        return
+    index_records(pop_scheduled_records(session))
+
+
+def index_scheduled_records_after_commit(session):
+    """Send the records scheduled in the transaction to the bulk queue."""
+    if 'communities_reindex' in session.info and \
+            current_app.config['COMMUNITIES_REINDEX_ASYNC']:
+        index_records(pop_scheduled_records(session))
+
+
+def discard_scheduled_records(session, transaction):
+    """Forget the records scheduled in a rolled back transaction."""
+    if transaction.parent is None:
+        pop_scheduled_records(session)
+
+
+def write_counters_before_commit(session):
+    """Write the counters deltas of the transaction."""
+    if CommunityCounter._session_key not in session.info:
+        return
+    transaction = session.transaction
+    if transaction is not None and transaction.nested:
+        return
+    CommunityCounter.write_deltas(session)
+
+
+def discard_counters(session, transaction):
+    """Forget the counters deltas of a rolled back transaction."""
+    if transaction.parent is None:
+        CommunityCounter.discard_deltas(session)
+
+
+def invalidate_communities_cache(mapper, connection, target):
+    """Invalidate the caches when a community or related object changes."""
+    invalidate_communities(inspect(target).session)
+
+
+def invalidate_permissions_cache(mapper, connection, action):
+    """Invalidate the caches when a communities permission changes."""
+    if action.action in CommunityPermissions.actions:
+        invalidate_communities(inspect(action).session)
+
+
+def bump_generation_before_commit(session):
+    """Increment the generation if the transaction modified communities."""
+    transaction = session.transaction
+    if transaction is not None and transaction.nested:
+        return
+    # Flush first, as the flush may invalidate the caches
+    session.flush()
+    if is_invalidated(session):
+        CommunityGeneration.bump(session)
+
+
+def forget_generation_after_commit(session):
+    """Read the new generation after a transaction modified communities."""
+    if pop_invalidation(session):
+        forget_generation()
+
+
+def discard_invalidation(session, transaction):
+    """Forget the modifications of a rolled back transaction."""
+    if transaction.parent is None:
+        pop_invalidation(session)
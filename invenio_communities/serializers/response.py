@@ -62,22 +62,32 @@ def community_responsify(schema_class, mimetype):
     :param mimetype: MIME type of response.
     """
     def view(data, code=200, headers=None, links_item_factory=None,
-             page=None, urlkwargs=None, links_pagination_factory=None):
+             page=None, urlkwargs=None, links_pagination_factory=None,
+             totals=True, fields=None):
         """Generate the response object."""
+        only = None
+        if fields is not None:
+            only = [f for f in fields if f in schema_class._declared_fields]
+        context = dict()
+        if links_item_factory is not None:
+            context['links_item_factory'] = links_item_factory
         if isinstance(data, Community):
             last_modified = data.updated
             response_data = schema_class(
-                context=dict(item_links_factory=links_item_factory)
+                context=context, only=only
             ).dump(data).data
         else:
             last_modified = None
+            # Reuse the total computed by the pagination
+            context.update(
+                total=data.total if totals else None,
+                page=page,
+                urlkwargs=urlkwargs)
+            if links_pagination_factory is not None:
+                context['links_pagination_factory'] = \
+                    links_pagination_factory
             response_data = schema_class(
-                context=dict(
-                    total=data.query.count(),
-                    item_links_factory=links_item_factory,
-                    page=page,
-                    urlkwargs=urlkwargs,
-                    pagination_links_factory=links_pagination_factory)
+                context=context, only=only
             ).dump(data.items, many=True).data
 
         response = current_app.response_class(
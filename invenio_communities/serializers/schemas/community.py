@@ -56,12 +56,10 @@ class CommunitySchemaV1(Schema):
         if not many:
             return data
 
-        result = dict(
-            hits=dict(
-                hits=data,
-                total=self.context.get('total', len(data))
-            )
-        )
+        result = dict(hits=dict(hits=data))
+        total = self.context.get('total', len(data))
+        if total is not None:
+            result['hits']['total'] = total
 
         page = self.context.get('page')
         if page:
@@ -29,24 +29,202 @@ from __future__ import absolute_import, print_function
 from datetime import datetime
 
 from celery import shared_task
+from flask import current_app
+from invenio_access.models import ActionRoles, ActionUsers
 from invenio_db import db
+from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
 
-from .models import Community, InclusionRequest
+from .cache import invalidate_communities
+from .indexer import CommunityRecordIndexer, reindex_records
+from .models import Community, CommunityCounter, CommunityDeletion, \
+    CommunityMembership, FeaturedCommunity, InclusionRequest
+from .utils import delete_logo
 
 
 @shared_task(ignore_result=True)
-def delete_marked_communities():
-    """Delete communities after holdout time."""
-    # TODO: Delete the community ID from all records metadata first
-    raise NotImplementedError()
-    Community.query.filter_by(
-        Community.delete_time > datetime.utcnow()).delete()
+def delete_marked_communities(chunk_size=None):
+    """Delete communities after holdout time.
+
+    The deletion of each community is checkpointed, so that an interrupted
+    run resumes where it stopped.
+
+    :param chunk_size: Maximum number of records processed per transaction.
+    """
+    chunk_size = chunk_size or \
+        current_app.config['COMMUNITIES_DELETE_CHUNK_SIZE']
+    deadline = datetime.utcnow() - \
+        current_app.config['COMMUNITIES_DELETE_HOLDOUT_TIME']
+    community_ids = [id_ for (id_, ) in db.session.query(Community.id).filter(
+        Community.deleted_at < deadline)]
+    for community_id in community_ids:
+        hard_delete_community(community_id, chunk_size)
+
+
+def _strip_records(community, after, chunk_size):
+    """Remove a community from a chunk of records.
+
+    The records are scanned by increasing ID after the given one. The JSON
+    text match is only a pre-filter, the records are checked one by one.
+
+    :returns: ID of the last scanned record, or ``None`` if none is left.
+    """
+    key = current_app.config['COMMUNITIES_RECORD_KEY']
+    query = RecordMetadata.query.filter(
+        RecordMetadata.json.isnot(None),
+        db.cast(RecordMetadata.json, db.Text).like(
+            u'%"{0}"%'.format(community.id)),
+    )
+    if after is not None:
+        query = query.filter(RecordMetadata.id > after)
+    models = query.order_by(RecordMetadata.id).limit(chunk_size).all()
+    if not models:
+        return None
+
+    oaiset = None
+    if current_app.config['COMMUNITIES_OAI_ENABLED']:
+        from invenio_oaiserver.models import OAISet
+        oaiset = OAISet.query.filter_by(
+            spec=community.oaiset_spec).one_or_none()
+    modified = []
+    for model in models:
+        record = Record(model.json, model=model)
+        if community.id not in record.get(key, []):
+            continue
+        record[key] = [c for c in record[key] if c != community.id]
+        if oaiset is not None and oaiset.has_record(record):
+            oaiset.remove_record(record)
+        record.commit()
+        modified.append(record.id)
+    reindex_records(modified)
+    return models[-1].id
+
+
+def hard_delete_community(community_id, chunk_size):
+    """Delete a community and remove it from all its records.
+
+    The records are processed in chunks, each committed with the deletion
+    checkpoint. The community, its requests, featured entries, permissions,
+    OAI set and logo are then deleted.
+
+    :param community_id: ID of the community marked for deletion.
+    :param chunk_size: Maximum number of records processed per transaction.
+    """
+    community = Community.query.get(community_id)
+    checkpoint = CommunityDeletion.query.get(community_id)
+    if checkpoint is None:
+        checkpoint = CommunityDeletion(id_community=community_id)
+        db.session.add(checkpoint)
+        db.session.commit()
+
+    while True:
+        last_record_id = _strip_records(
+            community, checkpoint.last_record_id, chunk_size)
+        if last_record_id is None:
+            break
+        checkpoint.last_record_id = last_record_id
+        db.session.commit()
+
+    reindex_records(set(id_record for (id_record, ) in db.session.query(
+        InclusionRequest.id_record).filter_by(id_community=community_id)))
+    InclusionRequest.query.filter_by(id_community=community_id).delete()
+    FeaturedCommunity.query.filter_by(id_community=community_id).delete()
+    CommunityMembership.query.filter_by(id_community=community_id).delete()
+    CommunityCounter.query.filter_by(id_community=community_id).delete()
+    for model in (ActionUsers, ActionRoles):
+        model.query.filter(
+            model.action.like('communities-%'),
+            model.argument == community_id,
+        ).delete(synchronize_session=False)
+    if community.logo_ext:
+        delete_logo(community_id, community.logo_ext)
+    db.session.delete(checkpoint)
+    db.session.flush()
+    db.session.delete(community)
     db.session.commit()
 
 
 @shared_task(ignore_result=True)
-def delete_expired_requests():
-    """Delete expired inclusion requests."""
-    InclusionRequest.query.filter_by(
-        InclusionRequest.expiry_date > datetime.utcnow()).delete()
+def delete_expired_requests(chunk_size=None):
+    """Delete expired inclusion requests.
+
+    The requests are deleted in chunks, each in its own short transaction,
+    and the affected records are reindexed to update their provisional
+    communities.
+
+    :param chunk_size: Maximum number of requests deleted per transaction.
+    """
+    chunk_size = chunk_size or \
+        current_app.config['COMMUNITIES_REQUEST_EXPIRY_CHUNK_SIZE']
+    now = datetime.utcnow()
+    while True:
+        record_ids = InclusionRequest.delete_expired(now, chunk_size)
+        if not record_ids:
+            break
+        reindex_records(record_ids)
+        invalidate_communities()
+        db.session.commit()
+
+
+@shared_task(ignore_result=True)
+def process_bulk_queue():
+    """Process the indexer bulk queue, prefetching the communities data.
+
+    Drop-in replacement of ``invenio_indexer.tasks.process_bulk_queue``
+    which avoids one query per record when (re)indexing many records.
+    """
+    CommunityRecordIndexer().process_bulk_queue()
+
+
+@shared_task(ignore_result=True)
+def update_communities_ranking():
+    """Compute the ranking of the communities from their activity.
+
+    The signals of all the communities are loaded with one aggregate query
+    each, and only the rankings which changed are written back, with a
+    single executemany UPDATE.
+    """
+    now = datetime.utcnow()
+    weights = current_app.config['COMMUNITIES_RANKING_WEIGHTS']
+    period = current_app.config['COMMUNITIES_RANKING_PERIOD']
+
+    counters = dict((row[0], row[1:]) for row in db.session.query(
+        CommunityCounter.id_community,
+        db.func.sum(CommunityCounter.records),
+        db.func.sum(CommunityCounter.requests),
+    ).group_by(CommunityCounter.id_community))
+    acceptances = dict(db.session.query(
+        CommunityMembership.id_community, db.func.count()
+    ).filter(
+        CommunityMembership.accepted_at >= now - period
+    ).group_by(CommunityMembership.id_community))
+
+    changes = []
+    for id_, ranking, fixed_points, last_accepted in db.session.query(
+            Community.id, Community.ranking, Community.fixed_points,
+            Community.last_record_accepted).filter(
+                Community.deleted_at.is_(None)):
+        records, requests = counters.get(id_, (0, 0))
+        recency = 0.0
+        if last_accepted is not None and last_accepted > now - period:
+            recency = 1 - (now - last_accepted).total_seconds() / \
+                period.total_seconds()
+        score = int(round(
+            weights['records'] * (records or 0) +
+            weights['requests'] * (requests or 0) +
+            weights['acceptances'] * acceptances.get(id_, 0) +
+            weights['recency'] * recency +
+            weights['fixed_points'] * fixed_points
+        ))
+        if score != ranking:
+            changes.append(dict(_id=id_, _ranking=score, _updated=now))
+
+    if changes:
+        table = Community.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('_id')).values(
+                ranking=db.bindparam('_ranking'),
+                updated=db.bindparam('_updated')),
+            changes)
+        invalidate_communities()
     db.session.commit()
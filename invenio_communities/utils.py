@@ -25,6 +25,8 @@
 
 from __future__ import absolute_import, print_function
 
+import base64
+import json
 import os
 from io import SEEK_END, SEEK_SET
 from math import ceil
@@ -76,6 +78,115 @@ class Pagination(object):
                 last = num
 
 
+class OffsetPagination(object):
+    """Page of a query located by offset, without counting the items.
+
+    Whether there is a next page is known by loading one more item.
+    """
+
+    def __init__(self, query, page, per_page):
+        """Load the page.
+
+        :param query: Query of all the items.
+        :param page: Number of the page, starting at 1.
+        :param per_page: Number of items per page.
+        """
+        self.query = query
+        self.page = page
+        self.per_page = per_page
+        items = query.limit(per_page + 1).offset(
+            (page - 1) * per_page).all()
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.has_prev = page > 1
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+    @property
+    def total(self):
+        """Return the total number of items."""
+        return self.query.order_by(None).count()
+
+
+class KeysetPagination(object):
+    """Page of a query ordered on a sort key and a unique key.
+
+    Unlike offset pagination, the page is located with an opaque cursor
+    built from the keys of the last item of the previous page, so deep pages
+    are as fast as the first ones and concurrent inserts do not shift them.
+    """
+
+    def __init__(self, query, sort_key, id_key, descending, cursor, per_page):
+        """Load the page.
+
+        :param query: Query of all the items.
+        :param sort_key: Column on which the items are ordered.
+        :param id_key: Unique column completing the order.
+        :param descending: If the items are ordered by descending keys.
+        :param cursor: Cursor of the page, ``None`` for the first page.
+        :param per_page: Number of items per page.
+        :raises ValueError: If the cursor is invalid or was built for another
+            sort.
+        """
+        self.query = query.order_by(None)
+        self.cursor = cursor or None
+        self.per_page = per_page
+        self._sort_key = sort_key.key
+        self._id_key = id_key.key
+        self._sort = '-' + self._sort_key if descending else self._sort_key
+
+        page_query = self.query
+        if self.cursor:
+            sort, value, id_ = self.decode_cursor(self.cursor)
+            if sort != self._sort:
+                raise ValueError('Cursor of another sort: {0}'.format(sort))
+            if descending:
+                page_query = page_query.filter(db.or_(
+                    sort_key < value,
+                    db.and_(sort_key == value, id_key < id_)))
+            else:
+                page_query = page_query.filter(db.or_(
+                    sort_key > value,
+                    db.and_(sort_key == value, id_key > id_)))
+        order = db.desc if descending else db.asc
+        items = page_query.order_by(
+            order(sort_key), order(id_key)).limit(per_page + 1).all()
+
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.next_cursor = self.encode_cursor(
+            self._sort,
+            getattr(self.items[-1], self._sort_key),
+            getattr(self.items[-1], self._id_key),
+        ) if self.has_next else None
+
+    @property
+    def total(self):
+        """Return the total number of items."""
+        return self.query.count()
+
+    @staticmethod
+    def encode_cursor(sort, value, id_):
+        """Build the opaque cursor of an item.
+
+        :param sort: Name of the sort key, prefixed with ``-`` if descending.
+        :param value: Value of the sort key of the item.
+        :param id_: Unique key of the item.
+        """
+        return base64.urlsafe_b64encode(
+            json.dumps([sort, value, id_]).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Get the sort, sort key and ID of the item of a cursor."""
+        try:
+            sort, value, id_ = json.loads(base64.urlsafe_b64decode(
+                cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError) as e:
+            raise ValueError('Invalid cursor: {0}'.format(e))
+        return sort, value, id_
+
+
 def render_template_to_string(input, _from_string=False, **context):
     """Render a template from the template folder with the given context.
 
@@ -120,6 +231,14 @@ def save_and_validate_logo(logo_stream, logo_filename, community_id):
         return None
 
 
+def delete_logo(community_id, ext):
+    """Delete the logo of a community from the logos bucket."""
+    bucket = Bucket.query.get(current_app.config['COMMUNITIES_BUCKET_UUID'])
+    key = "{0}/logo.{1}".format(community_id, ext)
+    if bucket is not None and ObjectVersion.get(bucket, key):
+        ObjectVersion.delete(bucket, key)
+
+
 def initialize_communities_bucket():
     """Initialize the communities file bucket.
 
@@ -26,19 +26,23 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import Blueprint, abort
-from flask_principal import ActionNeed
+import hashlib
+
+from flask import Blueprint, abort, current_app, request
+from invenio_db import db
 from invenio_rest import ContentNegotiatedMethodView
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from invenio_access import DynamicPermission
-
-from invenio_communities.links import default_links_item_factory, \
-    default_links_pagination_factory
+from invenio_communities.cache import get_generation, get_rest_cache, \
+    is_invalidated
+from invenio_communities.links import build_links_item_factory, \
+    default_links_item_factory, default_links_pagination_factory
 from invenio_communities.models import Community
-from invenio_communities.proxies import current_permission_factory
+from invenio_communities.permissions import identity_for_read_filter
 from invenio_communities.serializers import community_response
+from invenio_communities.serializers.schemas.community import CommunitySchemaV1
+from invenio_communities.utils import KeysetPagination, OffsetPagination
 
 blueprint = Blueprint(
     'invenio_communities_rest',
@@ -56,15 +60,66 @@ def get_communities(with_deleted=False):
     :type with_deleted: boolean
     :returns list: the list of communities
     """
-    communities = Community.filter_communities("",
-                                               "title",
-                                               with_deleted).all()
-    if not DynamicPermission(ActionNeed('admin-access')).can():
-        for i, c in enumerate(communities):
-            permission = current_permission_factory["communities-read"](c)
-            if not permission.can():
-                del communities[i]
-    return communities
+    return Community.filter_communities(
+        "", "title", with_deleted, identity=identity_for_read_filter()).all()
+
+
+def parse_fields(value):
+    """Get the community fields requested by a ``fields`` argument.
+
+    Only the fields dumped by the serializer can be requested.
+
+    :param value: Comma-separated list of fields.
+    :returns: List of the fields, always including ``id`` which is needed
+        for the links, or ``None`` if all the fields are requested.
+    """
+    if not value:
+        return None
+    requested = set(f.strip() for f in value.split(',') if f.strip())
+    dumped = CommunitySchemaV1._declared_fields
+    if not requested or any(f not in dumped for f in requested):
+        abort(400, 'Invalid fields.')
+    return sorted(requested | set(['id']))
+
+
+def load_only(requested, *columns):
+    """Get the query options loading only the requested fields.
+
+    :param requested: List of the requested fields, or ``None`` for all of
+        them, including the deferred page content.
+    :param columns: Names of other columns needed to build the response.
+    """
+    if requested is None:
+        return (Community.with_page_content(), )
+    return (db.load_only(*(set(requested) | set(columns))), )
+
+
+def _list_args(**kwargs):
+    """Normalize the parsed arguments selecting a page of the list."""
+    return '&'.join('{0}={1}'.format(k, kwargs[k]) for k in sorted(kwargs))
+
+
+def list_cache_key(**kwargs):
+    """Get the cache key of a page of the list of communities.
+
+    :param kwargs: Parsed arguments selecting the page of the list.
+    """
+    return u'communities:list:{0}:{1}:{2}:{3}'.format(
+        get_generation(), request.host_url, int(request.is_xhr),
+        _list_args(**kwargs))
+
+
+def list_version_id(**kwargs):
+    """Compute the version of a page of the list of communities.
+
+    The list only changes with the generation of the communities, so that
+    no query on the communities is needed.
+
+    :param kwargs: Parsed arguments selecting the page of the list.
+    :returns: Hash of the generation of the communities and the arguments.
+    """
+    return hashlib.sha1(u'{0}__{1}'.format(
+        get_generation(), _list_args(**kwargs)).encode('utf-8')).hexdigest()
 
 
 class CommunitiesResource(ContentNegotiatedMethodView):
@@ -87,7 +142,20 @@ class CommunitiesResource(ContentNegotiatedMethodView):
         size=fields.Int(
             location='query',
             missing=20,
-        )
+        ),
+        cursor=fields.String(
+            location='query',
+            missing=None,
+        ),
+        totals=fields.Boolean(
+            location='query',
+            missing=True,
+        ),
+        only=fields.String(
+            location='query',
+            load_from='fields',
+            missing=None,
+        ),
     )
 
     def __init__(self, serializers=None, *args, **kwargs):
@@ -99,9 +167,20 @@ class CommunitiesResource(ContentNegotiatedMethodView):
         )
 
     @use_kwargs(get_args)
-    def get(self, query, sort, page, size):
+    def get(self, query, sort, page, size, cursor, totals, only):
         """Get a list of all the communities.
 
+        The list is paginated with ``page``, or with ``cursor`` when it is
+        given. An empty ``cursor`` requests the first page, and the ``next``
+        link holds the cursor of the following one. With ``totals=false``
+        the communities are not counted and ``hits.total`` is omitted.
+        ``fields`` restricts the dumped and loaded fields (e.g.
+        ``fields=id,title``). The response has an ETag which changes with
+        the generation of the communities, and ``If-None-Match`` is answered
+        with a 304 when the page is unchanged. The responses are cached for
+        the current generation of the communities (see
+        ``COMMUNITIES_REST_CACHE``).
+
         .. http:get:: /communities/(string:id)
             Returns a JSON list with all the communities.
             **Request**:
@@ -132,28 +211,84 @@ class CommunitiesResource(ContentNegotiatedMethodView):
             'sort': sort,
             'size': size,
         }
+        if not totals:
+            urlkwargs['totals'] = 'false'
+        only = parse_fields(only)
+        if only is not None:
+            urlkwargs['fields'] = ','.join(only)
 
-        communities = Community.filter_communities(query, sort)
-        page = communities.paginate(page, size)
+        # The ETag and cached responses do not reflect the changes of the
+        # current transaction, if it modified the communities
+        etag = cache = None
+        if not is_invalidated():
+            etag = list_version_id(page=page, cursor=cursor, **urlkwargs)
+            self.check_etag(etag)
+            cache = get_rest_cache()
+        if cache is not None:
+            cache_key = list_cache_key(page=page, cursor=cursor, **urlkwargs)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                mimetype, data, headers = cached
+                response = current_app.response_class(
+                    data, mimetype=mimetype, headers=headers)
+                response.set_etag(etag)
+                return response
+
+        sort_key, descending = Community.sort_column(sort)
+        communities = Community.filter_communities(query, sort).options(
+            *load_only(only, sort_key.key))
+        if cursor is None and totals:
+            page = communities.paginate(page, size)
+        elif cursor is None:
+            if page < 1:
+                abort(404)
+            page = OffsetPagination(communities, page, size)
+        else:
+            if sort == 'relevance' and query and \
+                    current_app.config['COMMUNITIES_INDEXED_SEARCH']:
+                abort(400, 'Cursor pagination cannot sort by relevance.')
+            try:
+                page = KeysetPagination(communities, sort_key, Community.id,
+                                        descending, cursor, size)
+            except ValueError:
+                abort(400, 'Invalid cursor.')
 
         links = default_links_pagination_factory(page, urlkwargs)
 
         links_headers = map(lambda key: ('link', 'ref="{0}" href="{1}"'.format(
             key, links[key])), links)
 
-        return self.make_response(
+        response = self.make_response(
             page,
             headers=links_headers,
-            links_item_factory=default_links_item_factory,
+            links_item_factory=build_links_item_factory(),
             page=page,
             urlkwargs=urlkwargs,
             links_pagination_factory=default_links_pagination_factory,
+            totals=totals,
+            fields=only,
         )
+        if etag is not None:
+            response.set_etag(etag)
+        if cache is not None and response.status_code == 200:
+            cache.set(cache_key, (
+                response.mimetype, response.get_data(),
+                [h for h in response.headers if h[0].lower() == 'link'],
+            ), timeout=current_app.config['COMMUNITIES_REST_CACHE_TIMEOUT'])
+        return response
 
 
 class CommunityDetailsResource(ContentNegotiatedMethodView):
     """"Community details resource."""
 
+    get_args = dict(
+        only=fields.String(
+            location='query',
+            load_from='fields',
+            missing=None,
+        ),
+    )
+
     def __init__(self, serializers=None, *args, **kwargs):
         """Constructor."""
         super(CommunityDetailsResource, self).__init__(
@@ -162,9 +297,13 @@ class CommunityDetailsResource(ContentNegotiatedMethodView):
             **kwargs
         )
 
-    def get(self, community_id):
+    @use_kwargs(get_args)
+    def get(self, community_id, only):
         """Get the details of the specified community.
 
+        ``fields`` restricts the dumped and loaded fields (e.g.
+        ``fields=id,title``).
+
         .. http:get:: /communities/(string:id)
             Returns a JSON dictionary with the details of the specified
             community.
@@ -196,13 +335,24 @@ class CommunityDetailsResource(ContentNegotiatedMethodView):
             :statuscode 200: no error
             :statuscode 404: page not found
         """
-        community = Community.get(community_id)
+        # Answer the revalidations before loading the community
+        version = Community.get_updated(community_id)
+        if version is None:
+            abort(404)
+        etag = Community.compute_version_id(*version)
+        self.check_etag(etag)
+        self.check_if_modified_since(version.updated, etag=etag)
+
+        only = parse_fields(only)
+        community = Community.get(
+            community_id,
+            options=load_only(only, 'updated'))
         if not community:
             abort(404)
         etag = community.version_id
-        self.check_etag(etag)
         response = self.make_response(
-            community, links_item_factory=default_links_item_factory)
+            community, links_item_factory=default_links_item_factory,
+            fields=only)
         response.set_etag(etag)
         return response
 
@@ -25,34 +25,42 @@
 """Invenio module that adds support for communities."""
 
 import copy
+import hashlib
 from collections import namedtuple
 from functools import partial, wraps
 
 import bleach
 
-from flask import (Blueprint, abort, current_app, flash, jsonify, redirect,
-                   render_template, request, url_for)
+from flask import (Blueprint, abort, current_app, flash, jsonify,
+                   make_response, redirect, render_template, request,
+                   session, url_for)
+from flask_babelex import get_locale
 from flask_babelex import gettext as _
 from flask_login import current_user, login_required
-from flask_principal import ActionNeed
 from invenio_db import db
-from invenio_indexer.api import RecordIndexer
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.api import Record
 
-from invenio_access import DynamicPermission
 from invenio_access.models import ActionUsers
 from invenio_accounts.models import User
-from invenio_communities.errors import (InclusionRequestExistsError,
+from invenio_communities.cache import get_community, get_featured_community, \
+    get_generation, get_page_cache, invalidate_communities, is_invalidated
+from invenio_communities.errors import (CommunitiesError,
+                                        InclusionRequestExistsError,
+                                        InclusionRequestMissingError,
                                         InclusionRequestObsoleteError)
 from invenio_communities.forms import (CommunityForm,
                                        DeleteCommunityForm,
                                        EditCommunityForm,
                                        SearchForm)
+from invenio_communities.indexer import reindex_records
 from invenio_communities.models import (Community,
-                                        FeaturedCommunity,
+                                        CommunityCounter,
                                         InclusionRequest)
-from invenio_communities.proxies import current_permission_factory, needs
+from invenio_communities.permissions import identity_for_read_filter
+from invenio_communities.proxies import current_permission_factory, \
+    current_permissions, needs
 from invenio_communities.utils import Pagination, render_template_to_string
 
 blueprint = Blueprint(
@@ -77,20 +85,6 @@ def _get_needs(action, community=""):
     return needs[action]()
 
 
-def _get_permission(action, community=""):
-    """
-    :param action: the action to execute (i.e. "communities-read")
-    :type action: str
-    :param community: the community
-    :type community: str
-    :returns: permission the permission associated to this action with
-        this community as a parameter
-    """
-    if community:
-        return current_permission_factory[action](community)
-    return current_permission_factory[action]()
-
-
 def _get_permissions(remove_forbidden=True, sorted=True):
     """
     returns the list of all the permissions associated with the communities
@@ -107,11 +101,21 @@ def _get_permissions(remove_forbidden=True, sorted=True):
     return actions
 
 
-def pass_community(f):
-    """Decorator to pass community."""
+def pass_community(f=None, options=()):
+    """Decorator to pass community.
+
+    The community is loaded through the ``COMMUNITIES_OBJECT_CACHE``, unless
+    query options are given.
+
+    :param options: Query options used to load the community, e.g.
+        ``Community.with_page_content()``.
+    """
+    if f is None:
+        return partial(pass_community, options=options)
+
     @wraps(f)
     def inner(community_id, *args, **kwargs):
-        c = Community.get(community_id)
+        c = get_community(community_id, options=options)
         if c is None:
             abort(404)
         return f(c, *args, **kwargs)
@@ -123,9 +127,8 @@ def permission_required(action):
     def decorator(f):
         @wraps(f)
         def inner(community, *args, **kwargs):
-            permission = _get_permission(action, community)
-            if permission.can() \
-                    or DynamicPermission(ActionNeed('admin-access')).can():
+            if current_permissions.can(action, community) \
+                    or current_permissions.can('admin-access'):
                 return f(community, *args, **kwargs)
             abort(403)
         return inner
@@ -137,15 +140,71 @@ def permission_required_no_id(action):
     def decorator(f):
         @wraps(f)
         def inner(*args, **kwargs):
-            permission = _get_permission(action)
-            if permission.can() \
-                    or DynamicPermission(ActionNeed('admin-access')).can():
+            if current_permissions.can(action) \
+                    or current_permissions.can('admin-access'):
                 return f(*args, **kwargs)
             abort(403)
         return inner
     return decorator
 
 
+def page_cache_key():
+    """Get the cache key of the current page, or ``None`` if not cacheable.
+
+    Only the pages of the anonymous users without pending messages are the
+    same for every user.
+    """
+    if current_user.is_authenticated or session.get('_flashes') or \
+            is_invalidated():
+        return None
+    return u'communities:page:{0}:{1}:{2}'.format(
+        get_generation(), request.url, get_locale())
+
+
+def cached_page(f):
+    """Decorator caching the pages of the anonymous users.
+
+    The pages are cached in ``COMMUNITIES_PAGE_CACHE`` for the current
+    generation of the communities, and sent with caching headers for the
+    browsers and proxies.
+    """
+    @wraps(f)
+    def inner(*args, **kwargs):
+        cache = get_page_cache()
+        if cache is None:
+            return f(*args, **kwargs)
+        key = page_cache_key()
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            data, mimetype, headers = cached
+            response = current_app.response_class(
+                data, mimetype=mimetype, headers=headers)
+            response = response.make_conditional(request)
+        else:
+            response = make_response(f(*args, **kwargs))
+            # The pages setting a cookie are specific to the user
+            if key is not None and response.status_code == 200 and \
+                    not session.modified and \
+                    'Set-Cookie' not in response.headers:
+                cache.set(key, (
+                    response.get_data(), response.mimetype,
+                    [h for h in response.headers
+                     if h[0] == 'ETag'],
+                ), timeout=current_app.config[
+                    'COMMUNITIES_PAGE_CACHE_TIMEOUT'])
+            elif key is not None and response.status_code != 304:
+                key = None
+        if key is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = \
+                current_app.config['COMMUNITIES_PAGE_CACHE_MAX_AGE']
+        else:
+            response.cache_control.private = True
+        response.vary.update(('Cookie', 'Accept-Language'))
+        return response
+    return inner
+
+
 @blueprint.app_template_filter('format_item')
 def format_item(item, template, name='item'):
     """Render a template to a string with the provided item in context."""
@@ -156,21 +215,22 @@ def format_item(item, template, name='item'):
 @blueprint.app_template_filter('mycommunities_ctx')
 def mycommunities_ctx():
     """Helper method for return ctx used by many views."""
-    communities = Community.filter_communities("", "title").all()
-    mycommunities = [c for c in communities
-                     if _get_permission("communities-read", c).can()
-                     or DynamicPermission(ActionNeed('admin-access')).can()]
+    mycommunities = Community.filter_communities(
+        "", "title", identity=identity_for_read_filter()).all()
+    current_permissions.prefetch(mycommunities)
+    permission = current_permissions.permission
     return {
         "mycommunities": mycommunities,
-        "permission_admin": DynamicPermission(ActionNeed('admin-access')),
-        "permission_cadmin": partial(_get_permission, "communities-admin"),
-        "permission_curate": partial(_get_permission, "communities-curate"),
-        "permission_manage": partial(_get_permission, "communities-manage"),
-        "permission_read": partial(_get_permission, "communities-read"),
+        "permission_admin": permission('admin-access'),
+        "permission_cadmin": partial(permission, "communities-admin"),
+        "permission_curate": partial(permission, "communities-curate"),
+        "permission_manage": partial(permission, "communities-manage"),
+        "permission_read": partial(permission, "communities-read"),
     }
 
 
 @blueprint.route('/', methods=['GET', ])
+@cached_page
 def index():
     """Index page with uploader and list of existing depositions."""
     ctx = mycommunities_ctx()
@@ -181,15 +241,22 @@ def index():
 
     so = so or current_app.config.get('COMMUNITIES_DEFAULT_SORTING_OPTION')
 
-    communities = Community.filter_communities(p, so).all()
-    communities = [c for c in communities
-                   if _get_permission("communities-read", c).can()
-                   or DynamicPermission(ActionNeed('admin-access')).can()]
-    featured_community = FeaturedCommunity.get_featured_or_none()
-    form = SearchForm(p=p)
     per_page = 10
     page = max(page, 1)
-    p = Pagination(page, per_page, len(communities))
+    # Only the current page is fetched from the database, without the
+    # long text columns which are not displayed in the list.
+    communities = Community.filter_communities(
+        p, so, identity=identity_for_read_filter()
+    ).options(
+        db.undefer(Community.description),
+        db.joinedload(Community.owner),
+    ).paginate(page, per_page, error_out=False)
+    current_permissions.prefetch(communities.items)
+    featured_community = get_featured_community()
+    # The search form is submitted with GET, and a CSRF token would make the
+    # page specific to the user
+    form = SearchForm(p=p, csrf_enabled=False)
+    p = Pagination(page, per_page, communities.total)
 
     ctx.update({
         'r_from': max(p.per_page * (p.page - 1), 0),
@@ -198,7 +265,9 @@ def index():
         'pagination': p,
         'form': form,
         'title': _('Communities'),
-        'communities': communities[per_page * (page - 1):per_page * page],
+        'communities': communities.items,
+        'counters': CommunityCounter.get_totals(
+            [c.id for c in communities.items]),
         'featured_community': featured_community
     })
 
@@ -209,11 +278,13 @@ def index():
 
 
 @blueprint.route('/<string:community_id>/', methods=['GET'])
+@cached_page
 @pass_community
 @permission_required('communities-read')
 def detail(community):
     """Index page with uploader and list of existing depositions."""
-    return generic_item(community, "invenio_communities/detail.html")
+    return generic_item(community, "invenio_communities/detail.html",
+                        conditional=True)
 
 
 @blueprint.route('/<string:community_id>/search', methods=['GET'])
@@ -228,16 +299,46 @@ def search(community):
 
 
 @blueprint.route('/<string:community_id>/about/', methods=['GET'])
+@cached_page
 @pass_community
 @permission_required('communities-read')
 def about(community):
     """Index page with uploader and list of existing depositions."""
-    return generic_item(community, "invenio_communities/about.html")
+    return generic_item(community, "invenio_communities/about.html",
+                        conditional=True)
 
 
-def generic_item(community, template, **extra_ctx):
-    """Index page with uploader and list of existing depositions."""
-    # Check existence of community
+def community_page_etag(community, template):
+    """Get the ETag of a community page.
+
+    Only the pages of anonymous users are validated, as the pages of the
+    logged in users depend on their permissions. The ETag covers the
+    community, the generation of the communities, which changes with the
+    communities listed in the menu, the template and the locale. No
+    modification time is sent, as removing a community from the menu does
+    not move it forward.
+
+    :returns: The ETag, or ``None`` if the page cannot be validated.
+    """
+    if current_user.is_authenticated or session.get('_flashes'):
+        return None
+    return hashlib.sha1('{0}__{1}__{2}__{3}'.format(
+        community.version_id, get_generation(), template,
+        get_locale()).encode('utf-8')).hexdigest()
+
+
+def generic_item(community, template, conditional=False, **extra_ctx):
+    """Index page with uploader and list of existing depositions.
+
+    :param conditional: Send an ETag, and answer the conditional requests of
+        anonymous users before rendering the page.
+    """
+    etag = community_page_etag(community, template) if conditional else None
+    if etag is not None and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
     ctx = mycommunities_ctx()
     ctx.update({
         'is_owner': community.id_user == current_user.get_id(),
@@ -246,7 +347,10 @@ def generic_item(community, template, **extra_ctx):
     })
     ctx.update(extra_ctx)
 
-    return render_template(template, **ctx)
+    response = make_response(render_template(template, **ctx))
+    if etag is not None:
+        response.set_etag(etag)
+    return response
 
 
 @blueprint.route('/new/', methods=['GET', 'POST'])
@@ -302,7 +406,7 @@ def new():
 
 @blueprint.route('/<string:community_id>/edit/', methods=['GET', 'POST'])
 @login_required
-@pass_community
+@pass_community(options=[Community.with_page_content()])
 @permission_required('communities-manage')
 def edit(community):
     """Create or edit a community."""
@@ -381,6 +485,7 @@ def make_public(community):
     """Makes a community public."""
     ActionUsers.query.filter_by(action="communities-read",
                                 argument=community.id).delete()
+    invalidate_communities()
     db.session.commit()
     flash("{} is now public.".format(
                         current_app.config["COMMUNITIES_NAME"].capitalize()),
@@ -417,7 +522,7 @@ def curate(community):
         # Perform actions
         try:
             if action == "accept":
-                community.accept_record(record)
+                community.accept_record(record, user=current_user)
                 action_name = "added to"
             elif action == "reject":
                 community.reject_record(record)
@@ -434,8 +539,8 @@ def curate(community):
                          ' please refresh the page.')})
 
         record.commit()
+        reindex_records([record.id])
         db.session.commit()
-        RecordIndexer().index_by_id(record.id)
         title = ""
         if "title_statement" in record \
             and "title" in record["title_statement"]:
@@ -451,6 +556,143 @@ def curate(community):
     )
 
 
+CURATE_ACTIONS = {
+    'accept': ('success', 'added to'),
+    'reject': ('info', 'rejected from'),
+    'remove': ('info', 'removed from'),
+}
+"""Status and past participle of the curation actions."""
+
+
+def _record_title(record):
+    """Get the title of a record for the curation messages."""
+    if "title_statement" in record \
+            and "title" in record["title_statement"]:
+        return record["title_statement"]["title"]
+    return ""
+
+
+def _resolve_recids(recids):
+    """Resolve many recids to Records with one query per table.
+
+    :param recids: Iterable of record PID values.
+    :returns: Dictionary of Record objects indexed by PID value.
+    """
+    recids = set(str(recid) for recid in recids if recid)
+    if not recids:
+        return {}
+    uuids = {
+        pid.object_uuid: pid.pid_value
+        for pid in PersistentIdentifier.query.filter(
+            PersistentIdentifier.pid_type == 'recid',
+            PersistentIdentifier.object_type == 'rec',
+            PersistentIdentifier.status == PIDStatus.REGISTERED,
+            PersistentIdentifier.pid_value.in_(recids),
+        )
+    }
+    if not uuids:
+        return {}
+    return {uuids[record.id]: record
+            for record in Record.get_records(list(uuids.keys()))}
+
+
+@blueprint.route('/<string:community_id>/curate/bulk/', methods=['POST'])
+@login_required
+@pass_community
+@permission_required('communities-curate')
+def curate_bulk(community):
+    """Accept, reject or remove many records in one transaction.
+
+    Expects a JSON body ``{"items": [{"recid": ..., "action": ...}]}``. The
+    items are grouped by action and the status of each of them is returned
+    in the order they were given. A body of another shape is rejected with
+    a 400 error.
+
+    :param community_id: ID of the community to curate.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        abort(400)
+    items = data.get('items') or []
+    if not isinstance(items, list):
+        abort(400)
+    # The record ID and action of an item are scalar JSON values
+    valid = [
+        isinstance(item, dict) and not any(
+            isinstance(item.get(key), (dict, list))
+            for key in ('recid', 'action'))
+        for item in items
+    ]
+    records = _resolve_recids(
+        item.get('recid') for item, ok in zip(items, valid) if ok)
+
+    results = []
+    seen = set()
+    batches = dict((action, []) for action in CURATE_ACTIONS)
+    for item, ok in zip(items, valid):
+        if not ok:
+            results.append(({'recid': None, 'action': None,
+                             'status': 'danger', 'msg': _('Invalid item')},
+                            None))
+            continue
+        action = item.get('action')
+        record = records.get(str(item.get('recid')))
+        result = {'recid': item.get('recid'), 'action': action}
+        if record is None:
+            result.update(status='danger', msg=_('Unknown record'))
+        elif action not in CURATE_ACTIONS:
+            result.update(status='danger', msg=_('Unknown action'))
+        elif (action, record.id) not in seen:
+            seen.add((action, record.id))
+            batches[action].append(record)
+        results.append((result, record))
+
+    errors = {
+        'accept': community.accept_records(
+            batches['accept'], user=current_user),
+        'reject': community.reject_records(batches['reject']),
+        'remove': community.remove_records(batches['remove']),
+    }
+
+    # Only accepted and removed records are modified.
+    modified = dict(
+        (record.id, record)
+        for action in ('accept', 'remove')
+        for record in batches[action] if record.id not in errors[action]
+    )
+    for record in modified.values():
+        record.commit()
+    # The requests of the accepted and rejected records are deleted, even
+    # when the record was already in the community, which changes their
+    # provisional communities.
+    reindex_records(set(modified.keys()) | set(
+        record.id
+        for action in ('accept', 'reject')
+        for record in batches[action]
+        if not isinstance(errors[action].get(record.id),
+                          InclusionRequestMissingError)
+    ))
+    db.session.commit()
+
+    response = []
+    for result, record in results:
+        if 'status' not in result:
+            action = result['action']
+            if record.id in errors[action]:
+                result.update(
+                    status='danger',
+                    msg=_('record not in the curation list,'
+                          ' please refresh the page.'))
+            else:
+                status, action_name = CURATE_ACTIONS[action]
+                result.update(
+                    status=status,
+                    msg=_('The record "{}" has been {} the community.')
+                    .format(_record_title(record), action_name))
+        response.append(result)
+    return jsonify({'items': response})
+
+
 @blueprint.route('/suggest/', methods=['GET', 'POST'])
 @login_required
 # @permission_required('communities-read')  # tested later from the POST
@@ -477,8 +719,8 @@ def suggest():
                     current_app.config["COMMUNITIES_NAME"], community_id),
               "danger")
         return redirect(url)
-    if not _get_permission("communities-read", community).can() \
-            and not DynamicPermission(ActionNeed('admin-access')).can():
+    if not current_permissions.can("communities-read", community) \
+            and not current_permissions.can('admin-access'):
         flash(u"Error, you don't have permissions on the {} {}".format(
             current_app.config["COMMUNITIES_NAME"],
             community_id), "danger")
@@ -496,9 +738,9 @@ def suggest():
         return redirect(url)
     # if the user has the curate permission on this community,
     # we automatically add the record
-    if _get_permission("communities-curate", community).can():
+    if current_permissions.can("communities-curate", community):
         try:
-            community.add_record(record)
+            community.add_record(record, user=current_user)
         except:  # the record is already in the community
             flash(u"The record already exists in the {} {}.".format(
                 current_app.config["COMMUNITIES_NAME"],
@@ -528,8 +770,8 @@ def suggest():
                   u"to the {} {}.".format(
                                 current_app.config["COMMUNITIES_NAME"],
                                 community.title))
+    reindex_records([record.id])
     db.session.commit()
-    RecordIndexer().index_by_id(record.id)
     return redirect(url)
 
 
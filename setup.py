@@ -82,7 +82,7 @@ install_requires = [
     'invenio-accounts>=1.0.0a13',
     'invenio-access>=1.0.0a5',
     'invenio-assets>=1.0.0b2',
-    'invenio-db>=1.0.0b1',
+    'invenio-db>=1.0.0b3',
     'invenio-files-rest>=1.0.0.a1',
     'invenio-indexer>=1.0.0a6',
     'invenio-pidstore>=1.0.0a9',
@@ -125,6 +125,12 @@ setup(
         'invenio_base.api_apps': [
             'invenio_communities = invenio_communities:InvenioCommunities',
         ],
+        'invenio_db.alembic': [
+            'invenio_communities = invenio_communities:alembic',
+        ],
+        'invenio_db.models': [
+            'invenio_communities = invenio_communities.models',
+        ],
         'invenio_base.api_blueprints': [
             'invenio_communities = invenio_communities.views.api:blueprint',
         ],
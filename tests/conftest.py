@@ -79,6 +79,7 @@ def app(request):
         SERVER_NAME='inveniosoftware.org',
         THEME_SITEURL='https://localhost:5000',
         MAIL_SUPPRESS_SEND=True,
+        COMMUNITIES_REINDEX_ASYNC=False,
     )
     FlaskCLI(app)
     FlaskCeleryExt(app)
@@ -28,21 +28,37 @@
 from __future__ import absolute_import, print_function
 
 import json
+import re
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import pytest
 from flask import Flask
 from flask_cli import FlaskCLI
+from flask_principal import AnonymousIdentity, Identity, UserNeed
+from invenio_access.models import ActionUsers
+from invenio_accounts.testutils import create_test_user, login_user_via_session
 from invenio_db import db as db_
 from invenio_oaiserver.models import OAISet
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records.api import Record
+from mock import patch
+from sqlalchemy import event, inspect
 
 from invenio_communities import InvenioCommunities
+from invenio_communities.cache import forget_generation, get_community, \
+    get_featured_community, get_generation
 from invenio_communities.errors import CommunitiesError, \
-    InclusionRequestExistsError, InclusionRequestMissingError, \
-    InclusionRequestObsoleteError
-from invenio_communities.models import Community, FeaturedCommunity, \
-    InclusionRequest
+    CommunityRecordMissingError, InclusionRequestExistsError, \
+    InclusionRequestMissingError, InclusionRequestObsoleteError
+from invenio_communities.indexer import prefetched_communities, reindex_records
+from invenio_communities.models import Community, CommunityCounter, \
+    CommunityGeneration, CommunityMembership, CommunityTerm, \
+    FeaturedCommunity, InclusionRequest
+from invenio_communities.permissions import CommunityPermissions
+from invenio_communities.receivers import inject_communities, \
+    inject_provisional_community
 
 try:
     from werkzeug.urls import url_parse
@@ -131,6 +147,339 @@ def test_model_init(app, db, communities):
                   community=comm1, record=rec1)
 
 
+def test_model_deferred_page_content(app, db, communities):
+    """Test that the large text columns are only loaded on demand."""
+    content = set(['description', 'page', 'curation_policy'])
+    db_.session.expunge_all()
+    comm1 = Community.get('comm1')
+    assert content <= inspect(comm1).unloaded
+
+    # The inverted index is updated without loading the description
+    comm1.title = 'Renamed'
+    db_.session.commit()
+    assert set(t.term for t in CommunityTerm.query.filter_by(
+        id_community='comm1')) == set(['comm1', 'renamed', 'description1'])
+
+    db_.session.expunge_all()
+    comm1 = Community.get('comm1', options=[Community.with_page_content()])
+    assert not content & inspect(comm1).unloaded
+    assert comm1.description == 'Description1'
+
+
+def test_model_bulk_curation(app, db, communities):
+    """Test accepting, rejecting and removing many records at once."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazbar'})
+    rec3 = Record.create({'title': 'Spam'})
+    InclusionRequest.create(community=comm1, record=rec1)
+    InclusionRequest.create(community=comm1, record=rec2)
+    db_.session.commit()
+
+    errors = comm1.accept_records([rec1, rec3])
+    assert list(errors.keys()) == [rec3.id]
+    assert isinstance(errors[rec3.id], InclusionRequestMissingError)
+    assert rec1[communities_key] == ['comm1']
+    assert comm1.last_record_accepted is not None
+
+    errors = comm1.reject_records([rec2, rec3])
+    assert list(errors.keys()) == [rec3.id]
+    assert communities_key not in rec2
+    assert InclusionRequest.query.count() == 0
+
+    errors = comm1.remove_records([rec1, rec2])
+    assert list(errors.keys()) == [rec2.id]
+    assert isinstance(errors[rec2.id], CommunityRecordMissingError)
+    assert rec1[communities_key] == []
+
+
+def test_curate_bulk_reindex(app, db, communities, user):
+    """Test that the records whose request is deleted are reindexed."""
+    comm1 = communities[0]
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    records = []
+    for recid in range(1, 6):
+        record = Record.create({'title': 'Record {0}'.format(recid)})
+        PersistentIdentifier.create(
+            'recid', str(recid), object_type='rec', object_uuid=record.id,
+            status=PIDStatus.REGISTERED)
+        records.append(record)
+    accepted, rejected, obsolete, removed, missing = records
+    for record in (accepted, rejected, obsolete):
+        InclusionRequest.create(community=comm1, record=record)
+    comm1.add_record(removed)
+    # Already in the community, its request is deleted when accepting it
+    obsolete[communities_key] = ['comm1']
+    obsolete.commit()
+    db_.session.commit()
+
+    items = [{'recid': 1, 'action': 'accept'},
+             {'recid': 2, 'action': 'reject'},
+             {'recid': 3, 'action': 'accept'},
+             {'recid': 4, 'action': 'remove'},
+             {'recid': 5, 'action': 'reject'}]
+    with app.test_client() as client:
+        login_user_via_session(client, user=user)
+        with patch('invenio_communities.views.ui.reindex_records') as reindex:
+            response = client.post(
+                '/communities/comm1/curate/bulk/',
+                data=json.dumps({'items': items}),
+                content_type='application/json')
+        assert response.status_code == 200
+        statuses = [item['status'] for item in get_json(response)['items']]
+        assert statuses == ['success', 'info', 'danger', 'info', 'danger']
+        reindex.assert_called_once_with(set([
+            accepted.id, rejected.id, obsolete.id, removed.id]))
+    assert InclusionRequest.query.count() == 0
+
+
+def test_curate_bulk_invalid(app, db, communities, user):
+    """Test that the malformed bulk curations are rejected."""
+    db_.session.commit()
+    url = '/communities/comm1/curate/bulk/'
+    with app.test_client() as client:
+        login_user_via_session(client, user=user)
+        for data in ([], {'items': {}}, {'items': 'accept'}):
+            response = client.post(url, data=json.dumps(data),
+                                   content_type='application/json')
+            assert response.status_code == 400
+
+        items = ['accept', None, {'recid': [1], 'action': 'accept'},
+                 {'recid': 1, 'action': {}}, {'recid': 1, 'action': 'x'}]
+        response = client.post(url, data=json.dumps({'items': items}),
+                               content_type='application/json')
+        results = get_json(response, 200)['items']
+        assert [r['status'] for r in results] == ['danger'] * 5
+        assert [r['msg'] for r in results] == ['Invalid item'] * 4 + \
+            ['Unknown record']
+
+
+def test_reindex_records_after_commit(app, db):
+    """Test that the scheduled records are indexed once after commit."""
+    id1, id2, id3 = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    app.config['COMMUNITIES_REINDEX_ASYNC'] = True
+    with patch('invenio_communities.receivers.index_records') as index:
+        reindex_records([id1, id2])
+        reindex_records([id1])
+        db_.session.commit()
+        index.assert_called_once_with(set([id1, id2]))
+
+        index.reset_mock()
+        reindex_records([id3])
+        db_.session.rollback()
+        db_.session.commit()
+        assert not index.called
+
+
+@contextmanager
+def capture_queries(engine):
+    """Capture the SQL statements sent to the database."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_generation_read(statements):
+    """Assert that only the generation of the communities was queried."""
+    assert len(statements) == 1
+    assert 'communities_generation' in statements[0][0]
+
+
+def test_model_membership(app, db, communities, user):
+    """Test that the membership table follows the accepted records."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    rec1 = Record.create({'title': 'Foobar'})
+    InclusionRequest.create(community=comm1, record=rec1)
+    comm1.accept_record(rec1, user=user)
+    comm2.add_record(rec1)
+    db_.session.commit()
+
+    membership = CommunityMembership.get('comm1', rec1.id)
+    assert membership.accepted_by == user
+    assert membership.accepted_at is not None
+    assert CommunityMembership.get('comm2', rec1.id).id_user is None
+    assert CommunityMembership.get_by_community('comm1').count() == 1
+
+    comm1.remove_record(rec1)
+    db_.session.commit()
+    assert CommunityMembership.get('comm1', rec1.id) is None
+    assert [m.id_community for m in
+            CommunityMembership.get_by_record(rec1.id)] == ['comm2']
+
+    # The indexed communities can be built from the membership table
+    json = {communities_key: ['comm1', 'comm2']}
+    inject_communities(None, json=json, record=rec1)
+    assert json[communities_key] == ['comm1', 'comm2']
+    app.config['COMMUNITIES_INDEX_MEMBERSHIP'] = True
+    inject_communities(None, json=json, record=rec1)
+    assert json[communities_key] == ['comm2']
+
+
+def test_model_counters(app, db, communities):
+    """Test the sharded counters of the communities."""
+    (comm1, comm2, comm3) = communities
+    records = [Record.create({'title': str(i)}) for i in range(4)]
+    for record in records:
+        InclusionRequest.create(community=comm1, record=record)
+    db_.session.commit()
+    assert comm1.counters.records == 0
+    assert comm1.counters.requests == 4
+
+    comm1.accept_record(records[0])
+    comm1.accept_records(records[1:3])
+    db_.session.commit()
+    comm1.reject_record(records[3])
+    comm1.remove_record(records[0])
+    comm2.add_record(records[0])
+    db_.session.commit()
+
+    # A rolled back transaction does not change the counters
+    comm1.remove_record(records[1])
+    db_.session.rollback()
+
+    totals = CommunityCounter.get_totals(['comm1', 'comm2', 'comm3'])
+    assert totals['comm1'][:2] == (2, 0)
+    assert totals['comm1'].last_activity is not None
+    assert totals['comm2'][:2] == (1, 0)
+    assert totals['comm3'] == (0, 0, None)
+    assert CommunityCounter.query.filter_by(
+        id_community='comm1').count() <= \
+        app.config['COMMUNITIES_COUNTER_SHARDS']
+
+
+def test_model_generation(app, db, communities, user):
+    """Test the generation of the communities."""
+    db.session.commit()
+    generation = CommunityGeneration.get()
+    assert generation > 0
+    assert get_generation() == generation
+
+    # Rolled back and unrelated changes do not increment the generation
+    communities[0].title = 'Rolled back'
+    db.session.flush()
+    db.session.rollback()
+    db.session.add(ActionUsers(action='deposit-admin', user_id=user.id))
+    db.session.commit()
+    assert CommunityGeneration.get() == generation
+
+    communities[0].title = 'Changed'
+    db.session.commit()
+    assert CommunityGeneration.get() == generation + 1
+    assert get_generation() == generation + 1
+
+    # The global actions also grant access to the communities
+    db.session.add(ActionUsers(action='admin-access', user_id=user.id))
+    db.session.commit()
+    assert CommunityGeneration.get() == generation + 2
+
+    db.session.add(ActionUsers(action='communities-read', argument='comm1',
+                               user_id=user.id))
+    db.session.add(FeaturedCommunity(id_community='comm1',
+                                     start_date=datetime.utcnow()))
+    db.session.commit()
+    assert CommunityGeneration.get() == generation + 3
+
+
+def test_community_object_cache(app, db, communities):
+    """Test the read-through cache of the communities."""
+    app.config['COMMUNITIES_OBJECT_CACHE'] = \
+        'invenio_communities.cache:LRUCache'
+    db.session.commit()
+    assert get_community('comm1').title == 'Title1'
+    assert get_community('unknown') is None
+
+    # A new request reads the generation again
+    db.session.expunge_all()
+    forget_generation()
+    with capture_queries(db_.engine) as statements:
+        community = get_community('comm1')
+        assert community.title == 'Title1'
+        assert get_community('unknown') is None
+    assert_generation_read(statements)
+    assert community in db.session
+    # The deferred columns are loaded on access
+    assert community.description == 'Description1'
+
+    community.title = 'Changed'
+    db.session.commit()
+    db.session.expunge_all()
+    assert get_community('comm1').title == 'Changed'
+
+
+def test_prefetched_provisional_communities(app, db, communities):
+    """Test that the provisional communities are prefetched per batch."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazbar'})
+    InclusionRequest.create(community=comm2, record=rec1)
+    InclusionRequest.create(community=comm1, record=rec1)
+    db_.session.commit()
+
+    with prefetched_communities([rec1.id, rec2.id]):
+        json1, json2 = {}, {}
+        with capture_queries(db_.engine) as queries:
+            inject_provisional_community(None, json=json1, record=rec1)
+            inject_provisional_community(None, json=json2, record=rec2)
+        assert queries == []
+    assert json1 == {'provisional_communities': ['comm1', 'comm2']}
+    assert json2 == {'provisional_communities': []}
+
+    # Outside of a batch the communities are queried per record
+    json1 = {}
+    inject_provisional_community(None, json=json1, record=rec1)
+    assert json1 == {'provisional_communities': ['comm1', 'comm2']}
+
+
+def test_model_queries_use_indexes(app, db, communities, user):
+    """Test that the queries on the communities tables use an index."""
+    engine = db_.engine
+    if engine.name not in ('sqlite', 'postgresql'):
+        pytest.skip('Query plans are only checked on SQLite and PostgreSQL.')
+    app.config['COMMUNITIES_INDEXED_SEARCH'] = True
+    db_.session.add(FeaturedCommunity(id_community='comm1'))
+    db_.session.commit()
+
+    with capture_queries(engine) as statements:
+        Community.get('comm1')
+        Community.get_by_user(user.id).all()
+        Community.filter_communities('', 'title').all()
+        Community.filter_communities('', 'ranking').all()
+        if engine.name == 'sqlite':
+            Community.filter_communities('comm', 'relevance').all()
+        InclusionRequest.get('comm1', uuid.uuid4())
+        InclusionRequest.get_by_record(uuid.uuid4()).all()
+        InclusionRequest.query.filter(
+            InclusionRequest.expires_at < datetime.utcnow()).all()
+        FeaturedCommunity.get_featured_or_none()
+    assert statements
+
+    with engine.connect() as conn:
+        if engine.name == 'postgresql':
+            conn.execute('SET enable_seqscan = off')
+        for statement, parameters in statements:
+            if engine.name == 'sqlite':
+                plan = conn.execute(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                scans = [row[-1] for row in plan if re.match(
+                    r'^SCAN (TABLE )?communities_\w+$', row[-1])]
+            else:
+                plan = conn.execute(
+                    'EXPLAIN ' + statement, parameters).fetchall()
+                scans = [row[0] for row in plan
+                         if 'Seq Scan on communities_' in row[0]]
+            assert not scans, statement
+
+
 def test_email_notification(app, db, communities, user):
     """Test mail notification sending for community request."""
     # Mock the send method of the Flask-Mail extension
@@ -164,6 +513,38 @@ def test_model_featured_community(app, db, communities):
         start_date=t1 + timedelta(days=4)) is comm2
 
 
+def test_featured_community_cache(app, db, communities):
+    """Test the cache of the featured community."""
+    now = datetime.utcnow()
+    db.session.add(FeaturedCommunity(id_community='comm1',
+                                     start_date=now - timedelta(days=1)))
+    db.session.add(FeaturedCommunity(id_community='comm2',
+                                     start_date=now + timedelta(days=1)))
+    db.session.commit()
+
+    assert get_featured_community(now).id == 'comm1'
+    db_.session.expunge_all()
+    forget_generation()
+    with capture_queries(db_.engine) as statements:
+        featured = get_featured_community(now)
+        assert featured.id == 'comm1'
+        assert featured.description == 'Description1'
+    assert_generation_read(statements)
+
+    # The cache expires when the next featuring starts
+    assert get_featured_community(now + timedelta(days=2)).id == 'comm2'
+    forget_generation()
+    with capture_queries(db_.engine) as statements:
+        assert get_featured_community(now + timedelta(days=3)).id == 'comm2'
+    assert_generation_read(statements)
+
+    # And when the featuring is modified
+    db.session.add(FeaturedCommunity(id_community='oth3',
+                                     start_date=now + timedelta(days=2)))
+    db.session.commit()
+    assert get_featured_community(now + timedelta(days=3)).id == 'oth3'
+
+
 def test_oaipmh_sets(app, db, communities):
     """Test the OAI-PMH Sets creation."""
     (comm1, comm2, comm3) = communities
@@ -181,6 +562,29 @@ def test_oaipmh_sets(app, db, communities):
     assert OAISet.query.count() == 2
 
 
+def test_oaipmh_set_membership(app, db, communities):
+    """Test that adding many records to a set costs a constant query count."""
+    (comm1, comm2, comm3) = communities
+    oaiset_ids = app.extensions['invenio-communities'].oaiset_ids
+    records = [Record.create({'title': str(i)}) for i in range(5)]
+    db_.session.commit()
+    oaiset = comm1.oaiset
+    assert oaiset_ids['comm1'] == oaiset.id
+
+    with capture_queries(db_.engine) as queries:
+        comm1.add_records(records)
+    assert len(queries) == 1  # the pending inclusion requests
+    assert all(r['_oai']['sets'] == ['user-comm1'] for r in records)
+
+    comm1.remove_records(records)
+    assert all(r['_oai']['sets'] == [] for r in records)
+
+    # The cached primary key is dropped with the set
+    db_.session.delete(comm1)
+    db_.session.commit()
+    assert 'comm1' not in oaiset_ids
+
+
 def test_communities_rest_all_communities(app, db, communities):
     """Test the OAI-PMH Sets creation."""
     with app.test_client() as client:
@@ -192,6 +596,81 @@ def test_communities_rest_all_communities(app, db, communities):
         assert response_data['hits']['hits'][0]['id'] == 'comm1'
 
 
+def test_filter_communities_identity(app, db, communities, user):
+    """Test the SQL filtering of communities readable by an identity."""
+    (comm1, comm2, comm3) = communities
+    other = create_test_user('other@test.org')
+    db_.session.add(ActionUsers(action='communities-read',
+                                argument=comm1.id, user_id=user.id))
+    db_.session.add(ActionUsers(action='communities-read',
+                                argument=comm2.id, user_id=other.id))
+    db_.session.add(ActionUsers(action='communities-read', exclude=True,
+                                argument=comm3.id, user_id=user.id))
+    db_.session.commit()
+
+    def readable(identity):
+        return [c.id for c in Community.filter_communities(
+            '', 'title', identity=identity)]
+
+    def user_identity(u):
+        identity = Identity(u.id)
+        identity.provides.add(UserNeed(u.id))
+        return identity
+
+    # 'comm2' is restricted to 'other' and 'user' is excluded from 'oth3'
+    assert readable(user_identity(user)) == ['comm1']
+    assert readable(user_identity(other)) == ['oth3', 'comm2']
+    assert readable(AnonymousIdentity()) == ['oth3']
+    assert readable(None) == ['oth3', 'comm2', 'comm1']
+
+    # A global grant restricts all the communities
+    db_.session.add(ActionUsers(action='communities-read', user_id=other.id))
+    db_.session.commit()
+    assert readable(user_identity(user)) == ['comm1']
+    assert readable(user_identity(other)) == ['oth3', 'comm2', 'comm1']
+    assert readable(AnonymousIdentity()) == []
+
+    # Superusers read all the communities they are not excluded from, as
+    # with the permissions evaluator
+    db_.session.add(ActionUsers(action='superuser-access', user_id=user.id))
+    db_.session.commit()
+    identity = user_identity(user)
+    permissions = CommunityPermissions(identity)
+    assert readable(identity) == ['comm2', 'comm1']
+    assert readable(identity) == [c for c in ('oth3', 'comm2', 'comm1')
+                                  if permissions.can('communities-read', c)]
+
+
+def test_community_permissions(app, db, communities, user):
+    """Test the request-scoped communities permissions evaluator."""
+    (comm1, comm2, comm3) = communities
+    other = create_test_user('other@test.org')
+    db_.session.add(ActionUsers(action='communities-read',
+                                argument=comm1.id, user_id=user.id))
+    db_.session.add(ActionUsers(action='communities-curate',
+                                argument=comm1.id, user_id=other.id))
+    db_.session.add(ActionUsers(action='communities-read', exclude=True,
+                                argument=comm3.id, user_id=user.id))
+    db_.session.add(ActionUsers(action='admin-access', user_id=other.id))
+    db_.session.commit()
+
+    identity = Identity(user.id)
+    identity.provides.add(UserNeed(user.id))
+    permissions = CommunityPermissions(identity)
+    permissions.prefetch(communities)
+    assert permissions.can('communities-read', comm1)
+    assert permissions.can('communities-read', comm2)
+    assert not permissions.can('communities-read', comm3)
+    assert not permissions.can('communities-curate', comm1)
+    assert permissions.can('communities-curate', comm2)
+    assert not permissions.can('admin-access')
+    assert not permissions.permission('admin-access').can()
+
+    permissions = CommunityPermissions(AnonymousIdentity())
+    assert not permissions.can('communities-read', comm1)
+    assert permissions.can('communities-read', comm3.id)
+
+
 def test_community_delete(app, db, communities):
     """Test deletion of communities."""
     (comm1, comm2, comm3) = communities
@@ -219,6 +698,33 @@ def test_communities_rest_all_communities_query_and_sort(app, db, communities):
         assert response_data['hits']['hits'][1]['id'] == 'comm1'
 
 
+def test_indexed_search(app, db, communities):
+    """Test the indexed search of communities."""
+    (comm1, comm2, comm3) = communities
+    app.config['COMMUNITIES_INDEXED_SEARCH'] = True
+
+    def search(p, so='title'):
+        return [c.id for c in Community.filter_communities(p, so)]
+
+    assert CommunityTerm.tokenize('A <b>Foo</b>-bar') == {'a', 'foo', 'bar'}
+    assert search('title1') == ['comm1']
+    assert search('comm') == ['comm2', 'comm1']
+    assert search('comm descr') == ['comm1']
+    assert search('unknown') == []
+
+    # Terms are updated with the community
+    comm1.ranking = 10
+    comm2.description = 'Another description, describing it'
+    db_.session.commit()
+    assert search('another') == ['comm2']
+    assert search('descr', so='ranking') == ['comm1', 'comm2']
+    assert search('descr', so='relevance') == ['comm2', 'comm1']
+
+    db_.session.delete(comm3)
+    db_.session.commit()
+    assert CommunityTerm.query.filter_by(id_community='oth3').count() == 0
+
+
 def test_communities_rest_pagination(app, db, communities):
     """Test the OAI-PMH Sets creation."""
     def parse_path(app, path):
@@ -281,6 +787,57 @@ def test_communities_rest_pagination(app, db, communities):
         assert 'prev' in data['links']
         assert 'next' not in data['links']
 
+        # Cursor pagination, ordered on the sort key and the ID
+        for sort, expected in ((None, ['oth3', 'comm2', 'comm1']),
+                               ('title', ['oth3', 'comm2', 'comm1'])):
+            ids = []
+            url = '/api/communities/?size=2&cursor='
+            if sort:
+                url += '&sort=' + sort
+            while url:
+                data = get_json(client.get(**parse_path(app, url)), 200)
+                ids.extend(hit['id'] for hit in data['hits']['hits'])
+                assert data['hits']['total'] == 3
+                assert 'prev' not in data['links']
+                url = data['links'].get('next')
+            assert ids == expected
+
+        response = client.get('/api/communities/?cursor=invalid')
+        assert response.status_code == 400
+
+        # The cursors are only valid for the sort they were built for
+        data = get_json(client.get(
+            '/api/communities/?size=1&sort=title&cursor='), 200)
+        cursor = re.search('cursor=([^&]+)', data['links']['next']).group(1)
+        for sort in ('title', '-title', 'ranking'):
+            response = client.get(
+                '/api/communities/?size=1&sort={0}&cursor={1}'.format(
+                    sort, cursor))
+            assert response.status_code == (200 if sort == 'title' else 400)
+
+
+def test_communities_rest_totals(app, db, communities):
+    """Test that the list is counted at most once."""
+    def count_queries(statements):
+        return len([s for s, _ in statements if 'count(' in s.lower()])
+
+    with app.test_client() as client:
+        with capture_queries(db_.engine) as statements:
+            data = get_json(client.get('/api/communities/?size=1'), 200)
+        assert data['hits']['total'] == 3
+        assert count_queries(statements) == 1
+        assert data['hits']['hits'][0]['links']['self'] == \
+            'http://inveniosoftware.org/api/communities/{0}'.format(
+                data['hits']['hits'][0]['id'])
+
+        for url in ('/api/communities/?size=1&totals=false',
+                    '/api/communities/?size=1&totals=false&cursor='):
+            with capture_queries(db_.engine) as statements:
+                data = get_json(client.get(url), 200)
+            assert 'total' not in data['hits']
+            assert count_queries(statements) == 0
+            assert 'totals=false' in data['links']['next']
+
 
 def test_communities_rest_get_details(app, db, communities):
     """Test the OAI-PMH Sets creation."""
@@ -301,6 +858,186 @@ def test_communities_rest_get_details(app, db, communities):
         )
 
 
+def test_communities_rest_sparse_fields(app, db, communities):
+    """Test the restriction of the dumped and loaded fields."""
+    with app.test_client() as client:
+        db_.session.expunge_all()
+        with capture_queries(db_.engine) as statements:
+            data = get_json(client.get(
+                '/api/communities/comm1?fields=title'), 200)
+        assert set(data.keys()) == set(['id', 'title', 'links'])
+        assert data['title'] == 'Title1'
+        assert not any('curation_policy' in s for s, _ in statements)
+
+        data = get_json(client.get(
+            '/api/communities/?fields=id&sort=title&size=1&cursor='), 200)
+        assert [set(h.keys()) for h in data['hits']['hits']] == \
+            [set(['id', 'links'])]
+        assert 'fields=id' in data['links']['next']
+
+        assert client.get(
+            '/api/communities/comm1?fields=owner').status_code == 400
+        # Columns which are not dumped cannot be requested either
+        for fields in ('ranking', 'title,id_user', 'deleted_at'):
+            assert client.get('/api/communities/?fields={0}'.format(
+                fields)).status_code == 400
+
+
+def test_communities_rest_list_etag(app, db, communities):
+    """Test the ETag of the REST list of communities."""
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get('/api/communities/?sort=title')
+        assert response.status_code == 200
+        etag = response.headers.get('ETag')
+        assert etag
+
+        response = client.get('/api/communities/?sort=title', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 304
+        # Another page of the list has another ETag
+        response = client.get('/api/communities/?sort=title&page=2', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 200
+
+        # The list is not counted to compute the ETag
+        with capture_queries(db_.engine) as statements:
+            client.get('/api/communities/?sort=title&totals=false')
+        assert not any('count(' in s.lower() for s, _ in statements)
+
+        communities[0].title = 'Changed'
+        db.session.commit()
+        response = client.get('/api/communities/?sort=title', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 200
+        assert response.headers.get('ETag') != etag
+
+
+def test_communities_rest_cache(app, db, communities):
+    """Test the cache of the REST list of communities."""
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get('/api/communities/?sort=title&size=1')
+        data = get_json(response, 200)
+        # The test client shares the application context of the test
+        forget_generation()
+        with capture_queries(db_.engine) as statements:
+            cached = client.get('/api/communities/?size=1&sort=title')
+        assert_generation_read(statements)
+        assert get_json(cached, 200) == data
+        assert cached.headers.get('ETag') == response.headers.get('ETag')
+        assert [h for h in cached.headers if h[0] == 'link'] == \
+            [h for h in response.headers if h[0] == 'link']
+
+        # The links of the cached responses keep the scheme of the request
+        secure = client.get('/api/communities/?size=1&sort=title',
+                            base_url='https://localhost')
+        assert all(link.startswith('https://') for link in
+                   get_json(secure, 200)['links'].values())
+
+        # The cache is cleared when a community is modified
+        communities[2].title = 'Z'
+        db.session.commit()
+        data = get_json(client.get('/api/communities/?sort=title&size=1'))
+        assert data['hits']['hits'][0]['id'] == 'comm2'
+
+
+def test_communities_ui_etag(app, db, communities, user):
+    """Test the conditional requests of the community pages."""
+    db_.session.commit()
+    url = '/communities/comm1/'
+    with app.test_client() as client:
+        with patch('invenio_communities.views.ui.render_template',
+                   return_value='page') as render:
+            response = client.get(url)
+            assert response.status_code == 200
+            etag = response.headers.get('ETag')
+            assert etag
+            assert 'Last-Modified' not in response.headers
+
+            response = client.get(url, headers=(('If-None-Match', etag),))
+            assert response.status_code == 304
+            assert response.headers.get('ETag') == etag
+            assert render.call_count == 1
+
+            # Another page of the community has another ETag
+            assert client.get('/communities/comm1/about/', headers=(
+                ('If-None-Match', etag),)).status_code == 200
+
+            # Restricting another community changes the menu of the page
+            db_.session.add(ActionUsers(action='communities-read',
+                                        argument='comm2', user_id=user.id))
+            db_.session.commit()
+            response = client.get(url, headers=(('If-None-Match', etag),))
+            assert response.status_code == 200
+            assert response.headers.get('ETag') != etag
+
+            # The pages of the logged in users are not validated
+            login_user_via_session(client, user=user)
+            response = client.get(url, headers=(('If-None-Match', etag),))
+            assert response.status_code == 200
+            assert 'ETag' not in response.headers
+
+
+def test_communities_ui_page_cache(app, db, communities, user):
+    """Test the cache of the pages of the anonymous users."""
+    app.config['COMMUNITIES_PAGE_CACHE'] = \
+        'invenio_communities.cache:LRUCache'
+    db_.session.commit()
+    url = '/communities/comm1/about/'
+
+    def assert_cache_headers(response, public):
+        cache_control = response.headers.get('Cache-Control')
+        if public:
+            assert 'public' in cache_control
+            assert 'max-age={0}'.format(
+                app.config['COMMUNITIES_PAGE_CACHE_MAX_AGE']) in cache_control
+        else:
+            assert cache_control == 'private'
+        assert 'Cookie' in response.headers.get('Vary')
+        assert 'Accept-Language' in response.headers.get('Vary')
+
+    with app.test_client() as client:
+        with patch('invenio_communities.views.ui.render_template',
+                   return_value='page') as render:
+            response = client.get(url)
+            assert response.status_code == 200
+            assert_cache_headers(response, True)
+
+            forget_generation()
+            with capture_queries(db_.engine) as statements:
+                cached = client.get(url)
+            assert_generation_read(statements)
+            assert cached.status_code == 200
+            assert cached.get_data() == response.get_data()
+            assert cached.headers.get('ETag') == response.headers.get('ETag')
+            assert_cache_headers(cached, True)
+            assert render.call_count == 1
+
+            # The pages with messages are specific to the user
+            with client.session_transaction() as sess:
+                sess['_flashes'] = [('message', 'Hello')]
+            assert_cache_headers(client.get(url), False)
+            assert render.call_count == 2
+
+            # And so are the pages of the logged in users
+            with client.session_transaction() as sess:
+                sess.clear()
+            login_user_via_session(client, user=user)
+            assert_cache_headers(client.get(url), False)
+            assert render.call_count == 3
+            with client.session_transaction() as sess:
+                sess.clear()
+            assert_cache_headers(client.get(url), True)
+            assert render.call_count == 3
+
+            # Modifying the communities invalidates the pages
+            communities[0].title = 'Changed'
+            db_.session.commit()
+            assert client.get(url).status_code == 200
+            assert render.call_count == 4
+
+
 def test_communities_rest_etag(app, communities):
     """Test the OAI-PMH Sets creation."""
     with app.test_client() as client:
@@ -310,7 +1047,20 @@ def test_communities_rest_etag(app, communities):
         assert response.get_data(as_text=True) != ''
 
         # The second response is empty and the result code is 304
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
         response = client.get('/api/communities/comm1', headers=(
-            ('If-None-Match', response.headers.get('ETag')),))
+            ('If-None-Match', etag),))
         assert response.status_code == 304
         assert response.get_data(as_text=True) == ''
+
+        # The revalidations are answered without loading the community
+        response = client.get('/api/communities/comm1', headers=(
+            ('If-Modified-Since', last_modified),))
+        assert response.status_code == 304
+        assert response.headers.get('ETag') == etag
+
+        assert client.get('/api/communities/comm1', headers=(
+            ('If-None-Match', '"outdated"'),)).status_code == 200
+        assert client.get('/api/communities/unknown', headers=(
+            ('If-None-Match', etag),)).status_code == 404
@@ -26,9 +26,17 @@
 
 from __future__ import absolute_import, print_function
 
+from datetime import datetime, timedelta
+
+from invenio_db import db as db_
+from invenio_oaiserver.models import OAISet
 from invenio_records.api import Record
+from mock import patch
 
-from invenio_communities.models import InclusionRequest
+from invenio_communities.models import Community, CommunityDeletion, \
+    FeaturedCommunity, InclusionRequest
+from invenio_communities.tasks import delete_expired_requests, \
+    delete_marked_communities, update_communities_ranking
 
 
 def test_community_delete_task(app, db, communities):
@@ -45,3 +53,87 @@ def test_community_delete_task(app, db, communities):
 
     comm1.delete()
     assert comm1.is_deleted
+
+
+def test_delete_marked_communities_task(app, db, communities):
+    """Test the resumable hard deletion of the marked communities."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    records = [Record.create({'title': str(i)}) for i in range(3)]
+    for record in records:
+        InclusionRequest.create(community=comm1, record=record, notify=False)
+        comm1.accept_record(record)
+        comm2.add_record(record)
+        record.commit()
+    pending = Record.create({'title': 'Pending'})
+    InclusionRequest.create(community=comm1, record=pending, notify=False)
+    db_.session.add(FeaturedCommunity(id_community=comm1.id))
+    comm1.delete()
+    comm2.delete()
+    comm1.deleted_at = datetime.utcnow() - timedelta(days=366)
+    # Resume after the first record (in the order of the IDs)
+    first_id = min(r.id for r in records)
+    db_.session.add(CommunityDeletion(
+        id_community=comm1.id, last_record_id=first_id))
+    db_.session.commit()
+
+    with patch('invenio_communities.receivers.index_records') as index:
+        delete_marked_communities.delay(chunk_size=1)
+    reindexed = set().union(*[call[0][0] for call in index.call_args_list])
+    assert reindexed == set(r.id for r in records if r.id != first_id) | \
+        set([pending.id])
+
+    assert Community.query.get('comm1') is None
+    assert Community.query.get('comm2') is not None  # still in holdout
+    assert CommunityDeletion.query.count() == 0
+    assert InclusionRequest.query.count() == 0
+    assert FeaturedCommunity.query.count() == 0
+    assert OAISet.query.filter_by(spec='user-comm1').count() == 0
+    for record in Record.get_records([r.id for r in records]):
+        expected = ['comm2'] if record.id != first_id else ['comm1', 'comm2']
+        assert record[communities_key] == expected
+
+
+def test_delete_expired_requests(app, db, communities):
+    """Test the deletion of the expired inclusion requests."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazbar'})
+    req = InclusionRequest.create(community=comm1, record=rec1, notify=False)
+    assert req.expires_at > datetime.utcnow() + timedelta(days=364)
+    InclusionRequest.create(community=comm2, record=rec1, notify=False)
+    InclusionRequest.create(community=comm1, record=rec2, notify=False)
+    InclusionRequest.query.filter_by(id_record=rec1.id).update(
+        {'expires_at': datetime.utcnow() - timedelta(days=1)})
+    db_.session.commit()
+
+    with patch('invenio_communities.receivers.index_records') as index:
+        delete_expired_requests.delay(chunk_size=1)
+    assert index.call_count == 2
+    assert all(call[0][0] == set([rec1.id]) for call in index.call_args_list)
+    assert InclusionRequest.query.count() == 1
+    assert InclusionRequest.get(comm1.id, rec2.id)
+
+
+def test_update_communities_ranking(app, db, communities):
+    """Test the computation of the communities ranking."""
+    (comm1, comm2, comm3) = communities
+    app.config['COMMUNITIES_RANKING_WEIGHTS'] = dict(
+        records=1, requests=10, acceptances=100, recency=1000,
+        fixed_points=10000)
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazbar'})
+    InclusionRequest.create(community=comm1, record=rec1, notify=False)
+    comm1.accept_record(rec1)
+    InclusionRequest.create(community=comm1, record=rec2, notify=False)
+    comm3.fixed_points = 1
+    db_.session.commit()
+    comm2_updated = comm2.updated
+
+    update_communities_ranking.delay()
+    assert comm1.ranking == 1 + 10 + 100 + 1000
+    assert comm2.ranking == 0
+    assert comm2.updated == comm2_updated
+    assert comm3.ranking == 10000
+    assert [c.id for c in Community.filter_communities('', 'ranking')] == \
+        ['comm3', 'comm1', 'comm2']
@@ -28,7 +28,9 @@
 from __future__ import absolute_import, print_function
 
 from invenio_records.api import Record
+from mock import patch
 
+from invenio_communities.cache import LRUCache
 from invenio_communities.models import InclusionRequest
 from invenio_communities.utils import render_template_to_string
 
@@ -58,3 +60,25 @@ def test_email_formatting(app, db, communities, user):
         sent_msg = outbox[0]
         assert sent_msg.recipients == [user.email]
         assert comm1.title in sent_msg.body
+
+
+def test_lru_cache():
+    """Test the in-process cache."""
+    cache = LRUCache(threshold=2, default_timeout=10)
+    with patch('invenio_communities.cache.time', return_value=100):
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        # The least recently used entry is evicted
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        cache.set('d', 4, timeout=0)
+    with patch('invenio_communities.cache.time', return_value=110):
+        assert cache.get('a') is None
+        assert cache.get('d') == 4
+    assert cache.delete('d')
+    assert not cache.delete('d')
+    cache.set('a', 1)
+    cache.clear()
+    assert cache.get('a') is None